@@ -0,0 +1,195 @@
+import os
+import time
+import asyncio
+import logging
+import aiohttp
+from api.auth_api import get_headers, cached_headers
+from api.metrics import observe_request
+from api.decoding import loads, decode_data, project_product_mapping, project_variant
+from api.http_client import DEFAULT_HEADERS, HTTP_TIMEOUT, reauthorize
+from api.pagination import PageWalk
+from api.rate_limiter import get_rate_limiter, parse_retry_after, RATE_LIMIT_MAX_RETRIES
+from api.resilience import RETRY_MAX_ATTEMPTS, CircuitOpenError, backoff_delay, get_circuit_breaker, should_retry_status
+from api.mapping_api import BASE_URL, PRODUCT_MAPPINGS_PATH, PRODUCT_MAPPING_VARIANTS_PATH, ACCEPT_MAPPING_PATH, MAPPINGS_MAX_PAGES
+
+logger = logging.getLogger(__name__)
+
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 100))
+# max in-flight requests per endpoint
+ENDPOINT_CONCURRENCY = {
+    PRODUCT_MAPPINGS_PATH: int(os.getenv('ASYNC_MAPPINGS_CONCURRENCY', 10)),
+    PRODUCT_MAPPING_VARIANTS_PATH: int(os.getenv('ASYNC_VARIANTS_CONCURRENCY', 50)),
+    ACCEPT_MAPPING_PATH: int(os.getenv('ASYNC_ACCEPT_CONCURRENCY', 1)),
+}
+
+# one aiohttp session plus the per-endpoint semaphores, must be created inside the running loop
+class AsyncClient:
+    def __init__(self, pool_size=ASYNC_POOL_SIZE, endpoint_concurrency=None):
+        self.pool_size = pool_size
+        self.limits = {
+            endpoint: asyncio.Semaphore(limit)
+            for endpoint, limit in (endpoint_concurrency or ENDPOINT_CONCURRENCY).items()
+        }
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+            headers={k: v for k, v in DEFAULT_HEADERS.items() if v is not None},
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def post(self, endpoint, url, payload, idempotent=False, project=None):
+        # returns (status, decoded body or None), status is None when no response came back. with
+        # `project` the body is the response's data list projected into records. same
+        # retry, re-auth and circuit breaker rules as http_client.Transport.post
+        rate_limiter = get_rate_limiter()
+        bucket = rate_limiter.bucket(endpoint)
+        breaker = get_circuit_breaker(endpoint)
+        fresh = None
+        attempts = 1
+        throttled = 0
+        reauthorized = False
+        async with self.limits[endpoint]:
+            try:
+                breaker.check()
+            except CircuitOpenError as e:
+                logger.error(str(e))
+                return None, None
+            while True:
+                delay = bucket.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # read after the slot and the rate limiter wait, a request queued behind them would
+                # otherwise go out with a token that expired while it waited. a refresh blocks, so it runs off the loop
+                headers = fresh or cached_headers() or await asyncio.to_thread(get_headers)
+                fresh = None
+                try:
+                    start = time.monotonic()
+                    async with self.session.post(url, headers=headers, json=payload) as response:
+                        status = response.status
+                        retry_after = response.headers.get("Retry-After")
+                        raw = await response.read()
+                    observe_request(endpoint, status, len(raw), time.monotonic() - start)
+                    rate_limiter.record(endpoint, status, retry_after)
+                    try:
+                        body = loads(raw) if project is None else decode_data(raw, project)
+                    except ValueError:
+                        body = None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # unlike requests, aiohttp cant reliably tell a request that never left from one
+                    # that did, so only idempotent requests are resent after a connection error
+                    if idempotent and attempts < RETRY_MAX_ATTEMPTS and not breaker.is_open:
+                        delay = backoff_delay(attempts)
+                        logger.warning(f"{endpoint} request failed ({e!r}), retry {attempts} in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        attempts += 1
+                        continue
+                    breaker.record_failure()
+                    logger.error(f"{endpoint} request failed: {e!r}")
+                    return None, None
+
+                if status == 429 and throttled < RATE_LIMIT_MAX_RETRIES:
+                    throttled += 1
+                    continue
+                if status == 401 and not reauthorized:
+                    fresh = await asyncio.to_thread(reauthorize, headers)
+                    if fresh:
+                        reauthorized = True
+                        continue
+                if attempts < RETRY_MAX_ATTEMPTS and should_retry_status(status, idempotent) and not breaker.is_open:
+                    delay = backoff_delay(attempts, parse_retry_after(retry_after))
+                    logger.warning(f"{endpoint} returned {status}, retry {attempts} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    attempts += 1
+                    continue
+
+                if status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                return status, body
+
+async def get_product_mappings(client, item_brand_id, brand_name, max_pages=MAPPINGS_MAX_PAGES):
+    all_mappings = []
+    walk = PageWalk(PRODUCT_MAPPINGS_PATH, max_pages=max_pages)
+    page = walk.first_page
+
+    while True:
+        url = f"{BASE_URL}{PRODUCT_MAPPINGS_PATH}"
+        payload = {"page": page, "limit": walk.size, "itemBrandId": item_brand_id}
+        status, data = await client.post(PRODUCT_MAPPINGS_PATH, url, payload, idempotent=True, project=project_product_mapping)
+        if walk.rejected(status):
+            page = walk.first_page
+            continue
+        if status == 201:
+            if data is None:
+                logger.error(f"Product mappings response is not valid JSON for {brand_name} ({item_brand_id})")
+                break
+        else:
+            logger.error(f"Product mappings API call failed for {brand_name} ({item_brand_id}) on page {page} with status code: {status}")
+            break
+
+        if not data:
+            logger.info(f"No more product mappings data on {page} for {brand_name} ({item_brand_id})")
+            break
+
+        all_mappings.extend(data)
+        logger.info(f"Fetched {len(data)} product mappings from page {page} for {brand_name} ({item_brand_id})")
+
+        if not walk.advance(page, len(data)):
+            break
+
+        page += 1
+
+    if walk.truncated:
+        logger.warning(f"Product mappings crawl for {brand_name} ({item_brand_id}) hit the {max_pages} page cap after {len(all_mappings)} products, the rest were not crawled")
+    return all_mappings
+
+async def get_product_variants(client, product_id):
+    all_variants = []
+    walk = PageWalk(PRODUCT_MAPPING_VARIANTS_PATH)
+    page = walk.first_page
+
+    while True:
+        url = f"{BASE_URL}{PRODUCT_MAPPING_VARIANTS_PATH}".format(product_id=product_id)
+        payload = {"page": page, "limit": walk.size}
+        status, data = await client.post(PRODUCT_MAPPING_VARIANTS_PATH, url, payload, idempotent=True, project=project_variant)
+        if walk.rejected(status):
+            page = walk.first_page
+            continue
+
+        if status in (200, 201):
+            if data is None:
+                logger.error(f"product variants response is not valid JSON for product id: {product_id} on page {page}")
+                break
+        else:
+            logger.error(f"product variants API call failed for product id {product_id} on page {page} with status code: {status}")
+            break
+
+        if not data:
+            logger.debug("no more variants data on page %s for product id: %s", page, product_id)
+            break
+
+        all_variants.extend(data)
+        logger.debug("fetched %d variants from page %s for product id: %s", len(data), page, product_id)
+
+        if not walk.advance(page, len(data)):
+            break
+
+        page += 1
+
+    return all_variants
+
+async def accept_item_mappings(client, item_ids):
+    url = f"{BASE_URL}{ACCEPT_MAPPING_PATH}"
+    payload = {"itemIds": item_ids}
+    status, body = await client.post(ACCEPT_MAPPING_PATH, url, payload)
+    if status in (200, 201):
+        return body
+    logger.error(f"accept mapping API call failed with status code: {status}")
+    return None
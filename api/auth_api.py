@@ -1,8 +1,10 @@
 import os
 import json
 import time
-import requests
+import threading
 import logging
+import requests
+from api import http_client
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +21,14 @@ REFRESH_TOKEN_PATH = os.getenv('REFRESH_TOKEN_PATH')
 ACCESS_TOKEN_FILE_PATH = os.getenv('ACCESS_TOKEN_FILE_PATH')
 TOKEN_FILE = os.getenv("ACCESS_TOKEN_FILE_PATH", "token.json")
 X_FLIPINATOR_TOOLS = os.getenv('X_FLIPINATOR_TOOLS')
+# refresh this many ms before expiresAt so in-flight requests dont race the expiry
+TOKEN_REFRESH_MARGIN_MS = int(os.getenv('TOKEN_REFRESH_MARGIN_MS', 60 * 1000))
+
+# in-memory copy of token.json so we only touch disk / the refresh endpoint near expiresAt
+_token_data = None
+# bumped on every refresh attempt so callers that waited on the lock can reuse its result
+_token_generation = 0
+_token_lock = threading.RLock()
 
 def store_token_data(data):
     with open(TOKEN_FILE, 'w') as file:
@@ -30,12 +40,13 @@ def load_token_data():
             return json.load(file)
     return None
 
-def is_token_valid(token_data):
+def is_token_valid(token_data, margin_ms=0):
     # current time in milliseconds
     current_time = int(time.time() * 1000)
-    return token_data and current_time < token_data['data']['auth']['expiresAt']
+    return token_data and current_time + margin_ms < token_data['data']['auth']['expiresAt']
 
 def refresh_access_token():
+    global _token_data, _token_generation
     url = f'{BASE_URL}{REFRESH_TOKEN_PATH}'
     headers = {
         "App-Platform": APP_PLATFORM,
@@ -46,27 +57,73 @@ def refresh_access_token():
     params = {
         "refreshToken": REFRESH_TOKEN
     }
-    response = requests.post(url=url, headers=headers, json=params)
-    if response.status_code == 200:
-        token_data = response.json()
-        store_token_data(token_data)
-        return token_data['data']['auth']['accessToken']
+    with _token_lock:
+        _token_generation += 1
+        try:
+            response = http_client.post(url, endpoint=REFRESH_TOKEN_PATH, headers=headers, json=params)
+        except requests.RequestException as e:
+            _token_data = None
+            logger.error(f"Failed to refresh access token: {e}")
+            return None
+        if response.status_code == 200:
+            token_data = response.json()
+            store_token_data(token_data)
+            _token_data = token_data
+            return token_data['data']['auth']['accessToken']
 
-    logger.error(f"Failed to refresh access token. Status code: {response.status_code}")
-    return None
+        _token_data = None
+        logger.error(f"Failed to refresh access token. Status code: {response.status_code}")
+        return None
 
 def get_flip_access_token():
-    token_data = load_token_data()
-    if token_data and is_token_valid(token_data):
+    global _token_data
+    token_data = _token_data
+    if is_token_valid(token_data, TOKEN_REFRESH_MARGIN_MS):
         return token_data['data']['auth']['accessToken']
-    logger.info("Access token is missing or expired. Refreshing token...")
-    return refresh_access_token()
+
+    generation = _token_generation
+    with _token_lock:
+        # another caller refreshed while we waited on the lock - share its result instead of refreshing again
+        if generation != _token_generation:
+            token_data = _token_data
+            if is_token_valid(token_data):
+                return token_data['data']['auth']['accessToken']
+            return None
+
+        token_data = load_token_data()
+        if token_data and is_token_valid(token_data, TOKEN_REFRESH_MARGIN_MS):
+            _token_data = token_data
+            return token_data['data']['auth']['accessToken']
+        logger.info("Access token is missing or expired. Refreshing token...")
+        return refresh_access_token()
 
 def get_headers():
     token = get_flip_access_token()
+    # Accept and x-flipinator-tools are set once on the shared session
     headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Authorization": f"Bearer {token}",
-        "x-flipinator-tools": X_FLIPINATOR_TOOLS
+        "Authorization": f"Bearer {token}"
     }
-    return headers
\ No newline at end of file
+    return headers
+
+def cached_headers():
+    # headers from the in-memory token without ever refreshing, None when it is missing or about to expire
+    token_data = _token_data
+    if is_token_valid(token_data, TOKEN_REFRESH_MARGIN_MS):
+        return {"Authorization": f"Bearer {token_data['data']['auth']['accessToken']}"}
+    return None
+
+def reauthorize(rejected_authorization):
+    # called by the transport when a request comes back 401. only the first caller holding the
+    # rejected token refreshes, everyone else that got a 401 with it picks up the new one
+    with _token_lock:
+        token_data = _token_data
+        if is_token_valid(token_data) and f"Bearer {token_data['data']['auth']['accessToken']}" != rejected_authorization:
+            token = token_data['data']['auth']['accessToken']
+        else:
+            logger.info("Access token was rejected with 401. Refreshing token...")
+            token = refresh_access_token()
+    if not token:
+        return None
+    return {"Authorization": f"Bearer {token}"}
+
+http_client.set_reauth_handler(reauthorize)
@@ -1,7 +1,13 @@
 import json
+import time
 import logging
 import requests
+import threading
+from contextlib import closing
 from api.auth_api import get_headers
+from api import http_client
+from api.pagination import PageWalk, iter_sized_pages, post_page
+from api.data_dir import data_path, ensure_parent_dir
 from dotenv import load_dotenv
 import os
 
@@ -9,649 +15,218 @@ load_dotenv()
 
 BASE_URL = os.getenv('BASE_URL')
 BRANDS_LIST_PATH = '/shop/admin/brands/onboarding/list/v2'
+# single page lookups by name, the crawls negotiate their own page size
+BRANDS_LIMIT = 50
+# which brands to run and how to select them, replaces commenting get_<brand> functions in and out of main
+BRANDS_CONFIG_FILE = os.getenv('BRANDS_CONFIG_FILE', 'brands.json')
+# resolved brand name -> brands, so name selectors dont hit the brands list again on the next run
+BRAND_IDS_FILE = os.getenv('BRAND_IDS_FILE', data_path('brand_ids.json'))
+# a resolved name is looked up again after this long in case the brand was renamed or replaced
+BRAND_IDS_TTL = int(os.getenv('BRAND_IDS_TTL', 7 * 24 * 60 * 60))
+# a name the API confirmed has no brand is not looked up again for this long, so one bad name in
+# brands.json doesnt cost a brands list crawl every run
+BRAND_IDS_MISS_TTL = int(os.getenv('BRAND_IDS_MISS_TTL', 6 * 60 * 60))
+# upper bound on the unfiltered brands list crawl used to resolve names
+BRANDS_RESOLVE_MAX_PAGES = int(os.getenv('BRANDS_RESOLVE_MAX_PAGES', 40))
+# brands list pages fetched ahead while the brands already yielded are being processed
+BRANDS_PAGE_PREFETCH = int(os.getenv('BRANDS_PAGE_PREFETCH', 2))
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-### GET BY CONNECTOR ###
-
-def get_shopify_connected_brands():
+def post_brands_list(payload, label="brands"):
     url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page": 1,
-        "limit": 50,
-        "displayStatus": "live", # live brands only
-        "sort": "createdAt",
-        "order": "desc",
-        "provider": ["shopify"] # connector is shopify
-    }
-    
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("shopify brands list response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"shopify brands list API call failed with status code: {response.status_code}")
+    try:
+        response = http_client.post(url, endpoint=BRANDS_LIST_PATH, idempotent=True, headers=get_headers, json=payload)
+    except requests.RequestException as e:
+        logger.error(f"{label} brands list API call failed: {e}")
         return None
-    
-### GET BY CONNECTED PLATFORM ###
-    
-def get_italist_brands():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page": 1,
-        "limit": 50,
-        "displayStatus": "live", # live brands only
-        "sort": "createdAt",
-        "order": "desc",
-        "platform": ["italist"] # connected platform === italist
-    }
-    
-    response = requests.post(url, headers=headers, json=payload)
     if response.status_code == 201:
         try:
             return response.json()
         except json.JSONDecodeError:
-            logger.error("Italist brands list response is not valid JSON.")
+            logger.error(f"{label} brands list response is not valid JSON.")
             return None
     else:
-        logger.error(f"Italist brands list API call failed with status code: {response.status_code}")
+        logger.error(f"{label} brands list API call failed with status code: {response.status_code}")
         return None
-    
-def get_culture_kings_brands():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
+
+def load_brand_registry(path=BRANDS_CONFIG_FILE):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def normalize_brand_name(name):
+    return " ".join((name or "").split()).casefold()
+
+### GET BY CONNECTOR / CONNECTED PLATFORM ###
+
+def get_brands_by_filters(filters, label="brands"):
     payload = {
         "page": 1,
-        "limit": 50,
-        "displayStatus": "live", # live brands only
+        "limit": BRANDS_LIMIT,
         "sort": "createdAt",
         "order": "desc",
-        "platform": ["cultureKings"] # connected platform
+        **filters
     }
-    
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("brands list response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"brands list API call failed with status code: {response.status_code}")
-        return None
-    
-### GET BY BRAND NAME ###
-    
-def get_princess_polly():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Princess Polly", # princess polly only
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
+    return post_brands_list(payload, label)
 
-def get_refinery_no_1():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Refinery Number One", # refinery number one only
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_rustic_marlin():
+def iter_brands_by_filters(filters, label="brands", prefetch=BRANDS_PAGE_PREFETCH):
+    # streams every matching brand, not just the first page, the next page is already in flight
+    # while the caller works on the brands from this one
     url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Rustic Marlin", # rustic marlin only
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_uniikpillows():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"UniikPillows",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
+    walk = PageWalk(BRANDS_LIST_PATH)
 
-def get_doghugscat():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Dog Hugs Cat",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
+    def fetch_page(page, size):
+        payload = {
+            "page": page,
+            "limit": size,
+            "sort": "createdAt",
+            "order": "desc",
+            **filters
+        }
+        return post_page(url, BRANDS_LIST_PATH, payload)
 
-def get_lapopart():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Los Angeles Pop Art",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_liberal_repellent():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Liberal Repellent",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_belt_rhinestone():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Belt Rhinestone",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_thirdlove():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Thirdlove",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_harpro():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Harpro",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_galaxy_by_harvic():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Galaxy By Harvic",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_mothersgold():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Mothersgold",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_tictoc():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Tic Toc",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_petlife():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Pet Life",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_lauren_g_adams():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Lauren G Adams",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_moonlight_makers():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Moonlight Makers",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_bayeas():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Bayeas",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_pipa_fine_art():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"PIPA Fine Art",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
+    with closing(iter_sized_pages(walk, fetch_page, prefetch)) as pages:
+        for page, offset, status_code, data in pages:
+            if status_code != 201:
+                logger.error(f"{label} brands list API call failed on page {page} with status code: {status_code}")
+                break
+            if data is None:
+                logger.error(f"{label} brands list response is not valid JSON on page {page}.")
+                break
+            if not data:
+                break
 
-def get_onetify():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Onetify",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_mnml():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"MNML",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_pipa_fine_art():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"PIPA Fine Art",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None 
+            logger.info(f"Fetched {len(data)} {label} brands from page {page}")
+            yield from data
 
-def get_moomaya():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Moomaya",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None 
+### GET BY BRAND NAME ###
 
-def get_leg_avenue():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Leg Avenue",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None 
-    
-def get_directdeals():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Directdeals",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_anna_kaci():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Anna-Kaci",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_fine_color_jewels():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"Fine Color Jewels",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
-def get_fc_design():
-    url = f"{BASE_URL}{BRANDS_LIST_PATH}"
-    headers = get_headers()
-    payload = {
-        "page":1,
-        "limit":50,
-        "name":"FC Design",
-        "sort":"createdAt",
-        "order":"desc"
-        }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 201:
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            logger.error("response is not valid JSON.")
-            return None
-    else:
-        logger.error(f"API call failed with status code: {response.status_code}")
-        return None
-    
+# resolves every configured brand name with one crawl of the brands list instead of one request per name.
+# the cache file maps a name to {"brands", "checked_at"}; names with no brand are cached too, for less long
+class BrandNameResolver:
+    def __init__(self, names, cache_file=BRAND_IDS_FILE, max_pages=BRANDS_RESOLVE_MAX_PAGES, ttl=BRAND_IDS_TTL, miss_ttl=BRAND_IDS_MISS_TTL):
+        self.names = {normalize_brand_name(name): name for name in names}
+        self.cache_file = cache_file
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.resolved = None
+        self.lock = threading.Lock()
+
+    def load_cache(self):
+        if self.cache_file and os.path.exists(self.cache_file):
+            with open(self.cache_file, 'r') as file:
+                return json.load(file)
+        return {}
+
+    def is_fresh(self, entry, now):
+        # entries from before the cache had timestamps are plain lists and count as stale
+        if not isinstance(entry, dict):
+            return False
+        ttl = self.ttl if entry.get("brands") else self.miss_ttl
+        return now - entry.get("checked_at", 0) < ttl
+
+    def store_cache(self, resolved):
+        if self.cache_file:
+            ensure_parent_dir(self.cache_file)
+            with open(self.cache_file, 'w') as file:
+                json.dump(resolved, file)
+
+    def resolve(self):
+        with self.lock:
+            if self.resolved is None:
+                self.resolved = self._resolve()
+            return self.resolved
+
+    def _resolve(self):
+        now = time.time()
+        cache = {key: entry for key, entry in self.load_cache().items() if self.is_fresh(entry, now)}
+        resolved = {key: entry["brands"] for key, entry in cache.items()}
+        for key in self.names:
+            if key in resolved and not resolved[key]:
+                logger.warning(f"Brand name {self.names[key]} had no match when last looked up, skipping it until that expires")
+        missing = {key for key in self.names if key not in resolved}
+        if not missing:
+            return resolved
+
+        found = {}
+        url = f"{BASE_URL}{BRANDS_LIST_PATH}"
+        walk = PageWalk(BRANDS_LIST_PATH, max_pages=self.max_pages)
+
+        def fetch_page(page, size):
+            payload = {"page": page, "limit": size, "sort": "createdAt", "order": "desc"}
+            return post_page(url, BRANDS_LIST_PATH, payload)
+
+        with closing(iter_sized_pages(walk, fetch_page, 1)) as pages:
+            for page, offset, status_code, data in pages:
+                if status_code != 201 or data is None:
+                    logger.error(f"name resolution brands list API call failed on page {page} with status code: {status_code}")
+                    break
+                for brand in data:
+                    key = normalize_brand_name(brand.get("name"))
+                    if key in missing and brand.get("id"):
+                        found.setdefault(key, []).append({"id": brand["id"], "name": brand.get("name")})
+                missing -= found.keys()
+                logger.info(f"Brand name resolution page {page}: {len(found)} found, {len(missing)} still missing")
+                if not missing:
+                    break
+        if walk.truncated and missing:
+            logger.warning(f"Brand name resolution stopped at the {self.max_pages} page cap, looking up the rest by name")
+
+        # anything not on the crawled pages falls back to the old one request per name lookup. only a
+        # lookup the API answered counts as a miss worth caching, a failed one is retried next run
+        not_found = set()
+        for key in list(missing):
+            response = get_brands_by_filters({"name": self.names[key]}, self.names[key])
+            data = (response or {}).get("data") or []
+            if data:
+                found[key] = [{"id": brand.get("id"), "name": brand.get("name")} for brand in data if brand.get("id")]
+                missing.discard(key)
+            elif response is not None:
+                not_found.add(key)
+
+        for key in missing:
+            logger.warning(f"Could not resolve brand name {self.names[key]}")
+
+        resolved.update(found)
+        if found or not_found:
+            cache.update({key: {"brands": brands, "checked_at": now} for key, brands in found.items()})
+            cache.update({key: {"brands": [], "checked_at": now} for key in not_found})
+            self.store_cache(cache)
+        return resolved
+
+    def get(self, name):
+        return iter(self.resolve().get(normalize_brand_name(name), []))
+
+def brand_selectors(registry=None, keys=None):
+    # turns registry entries into get_brands_fn callables for process_mapping_accept that return an
+    # iterator of brands. all name based selectors share one resolver so they cost one brands list crawl together.
+    # each selector carries its eligibility rules, the registry's top level "rules" overridden by the entry's own,
+    # and the rules of every entry naming a brand so that brand keeps them when another selector returns it
+    registry = registry or load_brand_registry()
+    brands = registry["brands"]
+    keys = keys if keys is not None else registry.get("enabled", [])
+    unknown = [key for key in keys if key not in brands]
+    if unknown:
+        raise ValueError(f"unknown brands in registry selection: {unknown}")
+
+    resolver = BrandNameResolver([brands[key]["name"] for key in keys if "name" in brands[key]])
+    brand_rules = {
+        normalize_brand_name(entry["name"]): {**registry.get("rules", {}), **entry["rules"]}
+        for entry in brands.values() if "name" in entry and "rules" in entry
+    }
+    selectors = []
+    for key in keys:
+        entry = brands[key]
+        if "name" in entry:
+            def select(name=entry["name"]):
+                return resolver.get(name)
+        else:
+            def select(filters=entry.get("filters", {}), label=key):
+                return iter_brands_by_filters(filters, label)
+        select.__name__ = f"get_{key}"
+        select.rules = {**registry.get("rules", {}), **entry.get("rules", {})}
+        select.brand_rules = brand_rules
+        selectors.append(select)
+    return selectors
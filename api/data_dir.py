@@ -0,0 +1,16 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# where the state database, the resolved brand ids and the negotiated page sizes live unless their
+# own setting points somewhere else, kept out of the working directory so they never end up in the repo
+DATA_DIR = os.path.expanduser(os.getenv('MAPPINGBOT_DATA_DIR', '~/.mappingbot'))
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
+
+def ensure_parent_dir(path):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
@@ -0,0 +1,48 @@
+import json
+import hashlib
+from collections import namedtuple
+
+# orjson is optional, it decodes the big variant pages several times faster than the stdlib
+try:
+    import orjson
+    loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    loads = json.loads
+    JSON_BACKEND = "json"
+
+# the only variant fields the pipeline reads, everything else in a variants page is dropped on decode
+Variant = namedtuple("Variant", ["id", "inventory_amount", "item_mapping_id", "all_information_provided"])
+# a product mapping entry is only needed for its id and, for delta sync, whether it changed
+ProductMapping = namedtuple("ProductMapping", ["id", "fingerprint"])
+
+def fingerprint(value):
+    # always the stdlib encoder so fingerprints stay the same whichever backend decoded the page
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+def project_variant(variant):
+    # a null itemMapping becomes a variant without an item mapping id instead of a crash later on
+    item_mapping = variant.get("itemMapping") or {}
+    return Variant(
+        variant.get("id"),
+        variant.get("inventoryAmount") or 0,
+        item_mapping.get("id"),
+        bool(item_mapping.get("allInformationForImportProvided")),
+    )
+
+def project_product_mapping(product):
+    return ProductMapping(product.get("id"), fingerprint(product))
+
+def variants_from_rows(rows):
+    # records come back from the response cache's disk tier as plain JSON arrays, entries written
+    # before variants were projected are still full dicts
+    return [Variant(*row) if isinstance(row, list) else project_variant(row) for row in rows]
+
+def decode_data(content, project=None):
+    # returns the "data" list of a response body, projected item by item so the full dicts can be
+    # freed as soon as the page is decoded. raises ValueError when the body isnt valid JSON
+    # a "data": null page is an empty page, not an error
+    data = loads(content).get("data") or []
+    if project is None:
+        return data
+    return [project(item) for item in data]
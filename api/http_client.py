@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from api.metrics import transport_hook
+from api.rate_limiter import get_rate_limiter, parse_retry_after, RATE_LIMIT_MAX_RETRIES
+from api.resilience import (
+    RETRY_MAX_ATTEMPTS, backoff_delay, get_circuit_breaker, should_retry_exception, should_retry_status,
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+X_FLIPINATOR_TOOLS = os.getenv('X_FLIPINATOR_TOOLS')
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 32))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 30))
+# urllib3 level retries, left at 0 since retries with backoff are handled in Transport.post
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 0))
+# global budget of requests in flight at once across every thread, brand and endpoint
+HTTP_MAX_IN_FLIGHT = int(os.getenv('HTTP_MAX_IN_FLIGHT', 32))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "x-flipinator-tools": X_FLIPINATOR_TOOLS
+}
+
+# one pooled keep-alive session shared by every api module
+class Transport:
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES, headers=None, max_in_flight=HTTP_MAX_IN_FLIGHT):
+        self.timeout = timeout
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({k: v for k, v in (headers or DEFAULT_HEADERS).items() if v is not None})
+        # callables run after every request as hook(endpoint, response, elapsed_seconds)
+        self.hooks = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def send(self, url, endpoint, headers=None, **kwargs):
+        # one attempt: waits for the endpoint's rate limit and a global in-flight slot, then runs the
+        # hooks. callable headers are read once both waits are over, a request queued behind them
+        # would otherwise go out with a token that expired while it waited
+        rate_limiter = get_rate_limiter()
+        delay = rate_limiter.bucket(endpoint).reserve()
+        if delay > 0:
+            time.sleep(delay)
+        with self.in_flight:
+            if callable(headers):
+                headers = headers()
+            start = time.monotonic()
+            response = self.session.post(url, headers=headers, **kwargs)
+            elapsed = time.monotonic() - start
+        for hook in self.hooks:
+            try:
+                hook(endpoint, response, elapsed)
+            except Exception:
+                logger.exception(f"transport hook {hook} failed")
+        rate_limiter.record(endpoint, response.status_code, response.headers.get("Retry-After"))
+        return response
+
+    def post(self, url, endpoint=None, idempotent=False, **kwargs):
+        # every api call goes through here: 429s are always resent, 5xx and connection errors only
+        # when the request is idempotent (or provably never sent), a 401 triggers one token refresh,
+        # and an endpoint that keeps failing trips its circuit breaker so callers fail fast. `headers`
+        # may be a callable such as auth_api.get_headers, read again before every attempt
+        endpoint = endpoint or url
+        headers = kwargs.pop("headers", None)
+        fresh = None
+        kwargs.setdefault("timeout", self.timeout)
+        breaker = get_circuit_breaker(endpoint)
+        breaker.check()
+        attempts = 1
+        throttled = 0
+        reauthorized = False
+        while True:
+            try:
+                response = self.send(url, endpoint, headers=fresh or headers, **kwargs)
+            except requests.RequestException as exc:
+                if attempts < RETRY_MAX_ATTEMPTS and should_retry_exception(exc, idempotent) and not breaker.is_open:
+                    delay = backoff_delay(attempts)
+                    logger.warning(f"{endpoint} request failed ({exc}), retry {attempts} in {delay:.1f}s")
+                    time.sleep(delay)
+                    attempts += 1
+                    continue
+                breaker.record_failure()
+                raise
+
+            status_code = response.status_code
+            # a 429 means the request was never processed so it is always safe to send again
+            if status_code == 429 and throttled < RATE_LIMIT_MAX_RETRIES:
+                throttled += 1
+                continue
+            if status_code == 401 and not reauthorized:
+                # callable headers were read inside send, the token that got rejected is on the request
+                sent = {"Authorization": response.request.headers.get("Authorization")} if callable(headers) else headers
+                fresh = reauthorize(sent)
+                if fresh:
+                    reauthorized = True
+                    continue
+            if attempts < RETRY_MAX_ATTEMPTS and should_retry_status(status_code, idempotent) and not breaker.is_open:
+                delay = backoff_delay(attempts, parse_retry_after(response.headers.get("Retry-After")))
+                logger.warning(f"{endpoint} returned {status_code}, retry {attempts} in {delay:.1f}s")
+                time.sleep(delay)
+                attempts += 1
+                continue
+
+            if status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    def close(self):
+        self.session.close()
+
+# set by auth_api, called as handler(rejected_authorization_header) -> fresh auth headers or None
+_reauth_handler = None
+
+def set_reauth_handler(handler):
+    global _reauth_handler
+    _reauth_handler = handler
+
+def reauthorize(headers):
+    # swaps a rejected bearer token for a freshly refreshed one, requests without one are left alone
+    if not headers or not headers.get("Authorization") or _reauth_handler is None:
+        return None
+    fresh = _reauth_handler(headers["Authorization"])
+    return {**headers, **fresh} if fresh else None
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+                _transport.add_hook(transport_hook)
+    return _transport
+
+def post(url, endpoint=None, idempotent=False, **kwargs):
+    return get_transport().post(url, endpoint=endpoint, idempotent=idempotent, **kwargs)
@@ -1,7 +1,12 @@
-import json
 import logging
 import requests
-from api.auth_api import get_headers, get_flip_access_token
+from contextlib import closing
+from api.auth_api import get_headers
+from api import http_client
+from api.pagination import PageWalk, iter_sized_pages, post_page
+from api.decoding import project_product_mapping, project_variant
+from api.rate_limiter import get_rate_limiter
+from api.response_cache import variant_cache, cache_key
 from dotenv import load_dotenv
 import os
 
@@ -11,95 +16,137 @@ BASE_URL = os.getenv('BASE_URL')
 PRODUCT_MAPPINGS_PATH = '/shop/admin/product-mappings/v1'
 PRODUCT_MAPPING_VARIANTS_PATH = '/shop/admin/product-mappings/{product_id}/variants/v1'
 ACCEPT_MAPPING_PATH = '/shop/brand/items-mapping/accept/v1'
-LIMIT = 50
+# cap on product mappings pages per brand crawl, a brand with more is reported as truncated
+MAPPINGS_MAX_PAGES = int(os.getenv('MAPPINGS_MAX_PAGES', 100))
+
+# starting and ceiling requests/second per endpoint, the limiter moves between them based on server pushback
+rate_limiter = get_rate_limiter()
+rate_limiter.configure(PRODUCT_MAPPINGS_PATH, rate=float(os.getenv('MAPPINGS_RATE', 10)), max_rate=float(os.getenv('MAPPINGS_MAX_RATE', 30)))
+rate_limiter.configure(PRODUCT_MAPPING_VARIANTS_PATH, rate=float(os.getenv('VARIANTS_RATE', 20)), max_rate=float(os.getenv('VARIANTS_MAX_RATE', 100)))
+# accept used to sleep 1s after every batch, start there and let it climb
+rate_limiter.configure(ACCEPT_MAPPING_PATH, rate=float(os.getenv('ACCEPT_RATE', 1)), max_rate=float(os.getenv('ACCEPT_MAX_RATE', 10)))
+
+# pages kept in flight ahead of the one being consumed, 1 == fetch strictly one page after another.
+# most products only have one page of variants so prefetching there would mostly waste a request
+MAPPINGS_PAGE_PREFETCH = int(os.getenv('MAPPINGS_PAGE_PREFETCH', 3))
+VARIANTS_PAGE_PREFETCH = int(os.getenv('VARIANTS_PAGE_PREFETCH', 1))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(__name__)
 
-def get_product_mappings(item_brand_id, brand_name, max_pages=100):
-    all_mappings = []
-    page = 1
-
-    while page <= max_pages:
-        url = f"{BASE_URL}{PRODUCT_MAPPINGS_PATH}"
-        headers = get_headers()
-        payload = {"page": page, "limit": LIMIT, "itemBrandId": item_brand_id}
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 201:
-            try:
-                data = response.json().get("data", [])
-            except json.JSONDecodeError:
+def iter_product_mapping_pages(item_brand_id, brand_name, max_pages=MAPPINGS_MAX_PAGES, prefetch=MAPPINGS_PAGE_PREFETCH, first_item=0, outcome=None):
+    # yields (offset of the page's first product, ProductMapping records) one page at a time so callers
+    # can start on the first page right away, first_item lets a resumed run skip products it already
+    # finished. a page that still fails after the transport's retries ends the crawl and is recorded in
+    # outcome["failed_page"], hitting max_pages with more left in outcome["truncated_at"], so neither is a silent cut
+    url = f"{BASE_URL}{PRODUCT_MAPPINGS_PATH}"
+    walk = PageWalk(PRODUCT_MAPPINGS_PATH, first_item, max_pages)
+
+    def fetch_page(page, size):
+        payload = {"page": page, "limit": size, "itemBrandId": item_brand_id}
+        return post_page(url, PRODUCT_MAPPINGS_PATH, payload, project_product_mapping)
+
+    with closing(iter_sized_pages(walk, fetch_page, prefetch)) as pages:
+        for page, offset, status_code, data in pages:
+            if status_code != 201:
+                logger.error(f"Product mappings API call failed for {brand_name} ({item_brand_id}) on page {page} with status code: {status_code}")
+                if outcome is not None:
+                    outcome["failed_page"] = page
+                break
+            if data is None:
                 logger.error(f"Product mappings response is not valid JSON for {brand_name} ({item_brand_id})")
+                if outcome is not None:
+                    outcome["failed_page"] = page
                 break
-        else:
-            logger.error(f"Product mappings API call failed for {brand_name} ({item_brand_id}) on page {page} with status code: {response.status_code}")
-            break
-
-        if not data:
-            logger.info(f"No more product mappings data on {page} for {brand_name} ({item_brand_id})")
-            break
 
-        all_mappings.extend(data)
-        logger.info(f"Fetched {len(data)} product mappings from page {page} for {brand_name} ({item_brand_id})")
+            if not data:
+                logger.info("No more product mappings data on %s for %s (%s)", page, brand_name, item_brand_id)
+                break
 
-        #if the number of items is less than the limit its probably last page
-        if len(data) < LIMIT:
-            break
+            logger.info("Fetched %d product mappings from page %s for %s (%s)", len(data), page, brand_name, item_brand_id)
+            yield offset, data
 
-        page += 1
+    if walk.truncated:
+        truncated_at = walk.offset(walk.last_page + 1)
+        logger.warning(f"Product mappings crawl for {brand_name} ({item_brand_id}) hit the {walk.max_pages} page cap after {truncated_at} products, the rest were not crawled")
+        if outcome is not None:
+            outcome["truncated_at"] = truncated_at
 
+def get_product_mappings(item_brand_id, brand_name, max_pages=MAPPINGS_MAX_PAGES):
+    all_mappings = []
+    for offset, data in iter_product_mapping_pages(item_brand_id, brand_name, max_pages):
+        all_mappings.extend(data)
     return all_mappings
 
-def get_product_variants(product_id):
-    all_variants = []
-    page = 1
-
-    while True:
-        url = f"{BASE_URL}{PRODUCT_MAPPING_VARIANTS_PATH}".format(product_id=product_id)
-        headers = get_headers()
-        payload = {"page": page, "limit": LIMIT}
-        response = requests.post(url, headers=headers, json=payload)
-
-        if response.status_code in (200, 201):
-            try:
-                data = response.json().get("data", [])
-            except json.JSONDecodeError:
+def iter_product_variant_pages(product_id, prefetch=VARIANTS_PAGE_PREFETCH, refresh=False, outcome=None):
+    # yields pages of Variant records. pages are served from variant_cache while fresh, refresh=True
+    # skips the lookup but still stores the result. a page that fails ends the walk and is recorded in
+    # outcome["failed_page"] like it is for product mappings, the pages before it are incomplete
+    url = f"{BASE_URL}{PRODUCT_MAPPING_VARIANTS_PATH}".format(product_id=product_id)
+    walk = PageWalk(PRODUCT_MAPPING_VARIANTS_PATH)
+
+    def fetch_page(page, size):
+        # the size is part of the key, page 2 at one size isnt page 2 at another
+        key = cache_key(PRODUCT_MAPPING_VARIANTS_PATH, product_id, size, page)
+        if not refresh:
+            data = variant_cache.get(key)
+            if data is not None:
+                return 200, data
+        payload = {"page": page, "limit": size}
+        status_code, data = post_page(url, PRODUCT_MAPPING_VARIANTS_PATH, payload, project_variant)
+        if status_code in (200, 201) and data is not None:
+            variant_cache.put(key, data)
+        return status_code, data
+
+    with closing(iter_sized_pages(walk, fetch_page, prefetch)) as pages:
+        for page, offset, status_code, data in pages:
+            if status_code not in (200, 201):
+                logger.error(f"product variants API call failed for product id {product_id} on page {page} with status code: {status_code}")
+                if outcome is not None:
+                    outcome["failed_page"] = page
+                break
+            if data is None:
                 logger.error(f"product variants response is not valid JSON for product id: {product_id} on page {page}")
+                if outcome is not None:
+                    outcome["failed_page"] = page
                 break
-        else:
-            logger.error(f"product variants API call failed for product id {product_id} on page {page} with status code: {response.status_code}")
-            break
-
-        if not data:
-            logger.info(f"no more variants data on page {page} for product id: {product_id}")
-            break
-
-        all_variants.extend(data)
-        logger.info(f"fetched {len(data)} variants from page {page} for product id: {product_id}")
 
-        if len(data) < LIMIT:
-            break
+            if not data:
+                logger.debug("no more variants data on page %s for product id: %s", page, product_id)
+                break
 
-        page += 1
+            logger.debug("fetched %d variants from page %s for product id: %s", len(data), page, product_id)
+            yield data
 
+def get_product_variants(product_id, refresh=False, outcome=None):
+    all_variants = []
+    for data in iter_product_variant_pages(product_id, refresh=refresh, outcome=outcome):
+        all_variants.extend(data)
     return all_variants
 
 # /shop/brand/items-mapping/accept/v1
-def accept_item_mappings(item_ids, retry=True):
+def post_accept_item_mappings(item_ids):
+    # returns (status code, body or None, seconds the server took) so callers can tell a batch the
+    # server rejected from a failed call and time the endpoint without the rate limiter's waits.
+    # the status code is None when no response came back at all (network error or open circuit)
     url = f"{BASE_URL}{ACCEPT_MAPPING_PATH}"
-    headers = get_headers()
     payload = {"itemIds": item_ids}
-    response = requests.post(url, headers=headers, json=payload)
+    try:
+        response = http_client.post(url, endpoint=ACCEPT_MAPPING_PATH, headers=get_headers, json=payload)
+    except requests.RequestException as e:
+        logger.error(f"accept mapping API call failed: {e}")
+        return None, None, 0.0
+    elapsed = response.elapsed.total_seconds()
     if response.status_code in (200, 201):
-        return response.json()
-
-    elif response.status_code == 401 and retry:
-        logger.error("received 401 response - attempting to refresh access token and retry")
-        token = get_flip_access_token()
-        new_token = get_flip_access_token()
-        if new_token and new_token != token:
-            #retry the request once with the new token
-            return accept_item_mappings(item_ids, new_token, retry=False)
-    else:
-        logger.error(f"accept mapping API call failed with status code: {response.status_code}")
-    return None
\ No newline at end of file
+        try:
+            return response.status_code, response.json(), elapsed
+        except ValueError:
+            logger.error("accept mapping response is not valid JSON")
+            return response.status_code, None, elapsed
+    logger.error(f"accept mapping API call failed with status code: {response.status_code}")
+    return response.status_code, None, elapsed
+
+def accept_item_mappings(item_ids):
+    # a 401 is retried once with a refreshed token inside the transport
+    status_code, body, _ = post_accept_item_mappings(item_ids)
+    return body if status_code in (200, 201) else None
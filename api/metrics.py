@@ -0,0 +1,148 @@
+import os
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# prometheus text file rewritten after every run, e.g. for node_exporter's textfile collector. empty == off
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', '')
+# local /metrics scrape endpoint started by the daemon, 0 == off
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_PREFIX = 'mappingbot'
+
+# request latency buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_HELP = {
+    "api_requests_total": ("counter", "API responses by endpoint and status code"),
+    "api_response_bytes_total": ("counter", "response body bytes received by endpoint"),
+    "api_request_duration_seconds": ("histogram", "API request latency by endpoint"),
+    "products_scanned_total": ("counter", "product mappings seen by brand"),
+    "products_skipped_total": ("counter", "unchanged products skipped by delta sync by brand"),
+    "variants_scanned_total": ("counter", "variants checked by brand"),
+    "variants_filtered_total": ("counter", "variants not eligible for accept by brand"),
+    "variants_rejected_total": ("counter", "variants not eligible for accept by brand and the eligibility rule they failed"),
+    "ids_collected_total": ("counter", "itemMapping ids queued for accept by brand"),
+    "ids_accepted_total": ("counter", "itemMapping ids the accept endpoint reported as accepted by brand"),
+    "accept_batches_failed_total": ("counter", "accept batches that failed or were rejected by brand"),
+    "ids_dropped_total": ("counter", "pending itemMapping ids given up on by brand and reason, refused or out of attempts"),
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+# counters and histograms keyed by (name, sorted label items), cheap enough to update from every thread
+class MetricsRegistry:
+    def __init__(self, prefix=METRICS_PREFIX, help_text=None):
+        self.prefix = prefix
+        self.help_text = help_text or METRIC_HELP
+        self.counters = {}
+        # name -> {labels: [count per bucket..., sum, count]}
+        self.histograms = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        if not value:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.buckets.setdefault(name, buckets)
+            series = self.histograms.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def value(self, name, **labels):
+        with self.lock:
+            return self.counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        # prometheus text exposition format
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                full_name = f"{self.prefix}_{name}"
+                self._header(lines, name, full_name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                full_name = f"{self.prefix}_{name}"
+                self._header(lines, name, full_name, "histogram")
+                buckets = self.buckets[name]
+                for key, entry in sorted(series.items()):
+                    for bound, count in zip(buckets, entry):
+                        lines.append(f"{full_name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key + (('le', '+Inf'),))} {entry[-1]}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {entry[-2]:.6f}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {entry[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, full_name, default_type):
+        metric_type, help_text = self.help_text.get(name, (default_type, name))
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+
+metrics = MetricsRegistry()
+
+def observe_request(endpoint, status_code, response_bytes, elapsed):
+    metrics.inc("api_requests_total", endpoint=endpoint, status=status_code)
+    metrics.inc("api_response_bytes_total", response_bytes, endpoint=endpoint)
+    metrics.observe("api_request_duration_seconds", elapsed, endpoint=endpoint)
+
+def transport_hook(endpoint, response, elapsed):
+    # registered on the shared http_client transport, sees every sync request including token refreshes
+    observe_request(endpoint, response.status_code, len(response.content), elapsed)
+
+def write_textfile(path=METRICS_TEXTFILE):
+    # written to a temp file first so a collector never reads a half written file
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(metrics.render())
+    os.replace(tmp_path, path)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port=METRICS_PORT, host="127.0.0.1"):
+    # serves /metrics on a daemon thread, returns the server or None when no port is configured
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import logging
+import requests
+import threading
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from api.auth_api import get_headers
+from api import http_client
+from api.decoding import decode_data
+from api.data_dir import data_path, ensure_parent_dir
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PAGE_PREFETCH_WORKERS = int(os.getenv('PAGE_PREFETCH_WORKERS', 16))
+# page sizes probed on every paginated endpoint, largest first, empty string turns probing off. the
+# floor is the size the API has always accepted, so a page shorter than it is always the last one
+PAGE_SIZE_CANDIDATES = [int(size) for size in os.getenv('PAGE_SIZE_CANDIDATES', '500,200,100').split(',') if size.strip()]
+PAGE_SIZE_FLOOR = int(os.getenv('PAGE_SIZE_FLOOR', 50))
+# endpoint -> largest page size the server was seen to honour, kept between runs. empty string keeps it in memory
+PAGE_SIZES_FILE = os.getenv('PAGE_SIZES_FILE', data_path('page_sizes.json'))
+# a remembered size is probed again after this long in case the server limits changed
+PAGE_SIZE_RECHECK_SECONDS = int(os.getenv('PAGE_SIZE_RECHECK_SECONDS', 7 * 24 * 60 * 60))
+# statuses a server answers an oversized limit with
+PAGE_SIZE_REJECTED_STATUSES = (400, 413, 422)
+
+logger = logging.getLogger(__name__)
+
+prefetch_executor = ThreadPoolExecutor(max_workers=PAGE_PREFETCH_WORKERS, thread_name_prefix="page-prefetch")
+
+# largest page size each endpoint accepts. a size is accepted once the server answers it with a page
+# instead of refusing it, and confirmed once a full page of it comes back or a second page shows the
+# server quietly clamped it to a smaller one. only one crawl per endpoint probes an unknown size at a
+# time, the others use the floor meanwhile so a burst of concurrent crawls doesnt all get refused
+class PageSizes:
+    def __init__(self, candidates=PAGE_SIZE_CANDIDATES, floor=PAGE_SIZE_FLOOR, path=PAGE_SIZES_FILE, recheck_seconds=PAGE_SIZE_RECHECK_SECONDS):
+        self.floor = floor
+        self.candidates = sorted({size for size in candidates if size > floor}, reverse=True) + [floor]
+        self.path = path
+        self.recheck_seconds = recheck_seconds
+        # endpoint -> {"size", "confirmed", "checked_at"}
+        self.sizes = self.load()
+        self.rejected = {}
+        self.probing = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as file:
+                sizes = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable page sizes file {self.path}: {e}")
+            return {}
+        now = time.time()
+        return {endpoint: entry for endpoint, entry in sizes.items() if now - entry.get("checked_at", 0) < self.recheck_seconds}
+
+    def store(self):
+        if self.path:
+            ensure_parent_dir(self.path)
+            with open(self.path, 'w') as file:
+                json.dump(self.sizes, file)
+
+    def limit(self, endpoint):
+        # returns (page size to request, whether the server is known to honour it in full)
+        with self.lock:
+            entry = self.sizes.get(endpoint)
+            rejected = self.rejected.get(endpoint)
+            if entry and (rejected is None or entry["size"] < rejected):
+                return entry["size"], entry["confirmed"]
+            if endpoint in self.probing:
+                return self.floor, True
+            size = next(size for size in self.candidates if rejected is None or size < rejected or size == self.floor)
+            if size == self.floor:
+                return size, True
+            self.probing.add(endpoint)
+        return size, False
+
+    def release(self, endpoint):
+        # the probe failed for some other reason, the next crawl probes again
+        with self.lock:
+            self.probing.discard(endpoint)
+
+    def reject(self, endpoint, size):
+        # returns True when there is a smaller size left to try. a remembered size the server now
+        # refuses is forgotten, it may have lowered its limit or BASE_URL points at another server
+        with self.lock:
+            entry = self.sizes.get(endpoint)
+            if entry and entry["size"] >= size:
+                del self.sizes[endpoint]
+                self.store()
+            if size <= self.floor:
+                return False
+            self.probing.discard(endpoint)
+            self.rejected[endpoint] = min(size, self.rejected.get(endpoint, size))
+        logger.warning(f"{endpoint} refused page size {size}, trying a smaller one")
+        return True
+
+    def accept(self, endpoint, size, confirmed=False, clamped=False):
+        with self.lock:
+            self.probing.discard(endpoint)
+            entry = self.sizes.get(endpoint)
+            if entry and entry["size"] == size and (entry["confirmed"] or not confirmed):
+                return
+            self.sizes[endpoint] = {"size": size, "confirmed": confirmed, "checked_at": time.time()}
+            self.store()
+        if clamped:
+            logger.info(f"{endpoint} clamps pages to {size} items, using that page size")
+        else:
+            logger.info(f"{endpoint} accepts page size {size}{'' if confirmed else ', not yet seen a full page of it'}")
+
+page_sizes = PageSizes()
+
+# position and page size of one paginated crawl. pages are numbered at the walk's size, so a resumed
+# crawl passes the number of items already done and starts on the page holding the next one
+class PageWalk:
+    def __init__(self, endpoint, first_item=0, max_pages=None, sizes=None):
+        self.endpoint = endpoint
+        self.first_item = first_item
+        self.max_pages = max_pages
+        self.sizes = sizes or page_sizes
+        self.truncated = False
+        self.restarts = 0
+        self.start()
+
+    def start(self):
+        self.size, self.confirmed = self.sizes.limit(self.endpoint)
+        if self.first_item and not self.confirmed:
+            # a size that turns out clamped would shift the offsets of the pages a resumed crawl skips
+            self.sizes.release(self.endpoint)
+            self.size, self.confirmed = self.sizes.floor, True
+        self.first_page = self.first_item // self.size + 1
+        self.received = False
+        self.short_page = None
+
+    @property
+    def last_page(self):
+        # max_pages counts from where the walk starts, so a resumed crawl gets a full allowance
+        return None if self.max_pages is None else self.first_page + self.max_pages - 1
+
+    def offset(self, page):
+        # number of items before `page`
+        return (page - 1) * self.size
+
+    def looks_full(self, count):
+        # whether a page of `count` items probably has another after it, a short page at an
+        # unconfirmed size only rules that out below the floor
+        return count >= (self.size if self.confirmed else self.sizes.floor)
+
+    def rejected(self, status_code):
+        # called with the status of each page before its data, True when the server refused the page
+        # size before sending any page. the walk then restarts at a smaller size from first_page, at
+        # most once per candidate size. a confirmed size can be refused too when it was remembered
+        # from an earlier run
+        if self.received:
+            return False
+        if status_code in (200, 201):
+            self.received = True
+            if not self.confirmed:
+                self.sizes.accept(self.endpoint, self.size)
+            return False
+        if status_code not in PAGE_SIZE_REJECTED_STATUSES:
+            if not self.confirmed:
+                self.sizes.release(self.endpoint)
+            return False
+        if self.restarts >= len(self.sizes.candidates) or not self.sizes.reject(self.endpoint, self.size):
+            return False
+        self.restarts += 1
+        self.start()
+        return True
+
+    def advance(self, page, count):
+        # called with the length of each page in order, returns True if another page follows it
+        self.received = True
+        if not count:
+            return False
+        if self.short_page is not None:
+            # a page after a short one, so the short one was a full page at the server's own size
+            self.size, self.confirmed = self.short_page, True
+            self.sizes.accept(self.endpoint, self.size, confirmed=True, clamped=True)
+            self.short_page = None
+        if count >= self.size:
+            if not self.confirmed:
+                self.confirmed = True
+                self.sizes.accept(self.endpoint, self.size, confirmed=True)
+            more = True
+        elif count < self.sizes.floor:
+            more = False
+        else:
+            # either the last page or the server clamps below this size, which it may have started
+            # doing since the size was confirmed. only the next page can tell
+            self.short_page = count
+            more = True
+        if more and self.max_pages is not None and page >= self.last_page:
+            self.truncated = True
+            return False
+        return more
+
+def post_page(url, endpoint, payload, project=None):
+    # returns (status code, page data or None if the body isnt valid JSON), logging is left to the
+    # paginator so speculative pages past the end dont show up in the logs. pages are reads so the
+    # transport may retry them, the status code is None if it gave up without a response.
+    # `project` turns each item into a compact record while the page is decoded
+    try:
+        response = http_client.post(url, endpoint=endpoint, idempotent=True, headers=get_headers, json=payload)
+    except requests.RequestException as e:
+        logger.error(f"{endpoint} request failed: {e}")
+        return None, None
+    if response.status_code not in (200, 201):
+        return response.status_code, None
+    try:
+        return response.status_code, decode_data(response.content, project)
+    except ValueError:
+        return response.status_code, None
+
+def iter_pages(fetch_page, prefetch, max_pages=None, first_page=1, full=None):
+    # yields (page, status code, data) strictly in page order while keeping up to `prefetch` pages
+    # in flight; pages still queued when the caller stops are cancelled, running ones are discarded.
+    # with full(status code, data), one page at a time is fetched until a page comes back full, so
+    # the many crawls that fit on a single page dont pay for speculative requests
+    if prefetch <= 1:
+        page = first_page
+        while max_pages is None or page <= max_pages:
+            yield (page, *fetch_page(page))
+            page += 1
+        return
+
+    in_flight = deque()
+    next_page = first_page
+    window = 1 if full else prefetch
+
+    def fill():
+        nonlocal next_page
+        while len(in_flight) < window and (max_pages is None or next_page <= max_pages):
+            in_flight.append((next_page, prefetch_executor.submit(fetch_page, next_page)))
+            next_page += 1
+
+    try:
+        while True:
+            fill()
+            if not in_flight:
+                return
+            page, future = in_flight.popleft()
+            result = future.result()
+            if window < prefetch and full(*result):
+                # the next pages go out before the caller starts on this one
+                window = prefetch
+                fill()
+            yield (page, *result)
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+def iter_sized_pages(walk, fetch_page, prefetch):
+    # yields (page, offset, status code, data) like iter_pages, fetching with fetch_page(page, size) at
+    # the walk's page size. stops after the last page or the first failed one, and starts over at a
+    # smaller size if the server refuses the one it was given
+    while True:
+        full = lambda status_code, data: status_code in (200, 201) and data is not None and walk.looks_full(len(data))
+        with closing(iter_pages(lambda page: fetch_page(page, walk.size), prefetch, walk.last_page, walk.first_page, full)) as pages:
+            for page, status_code, data in pages:
+                if walk.rejected(status_code):
+                    break
+                if status_code not in (200, 201) or data is None:
+                    yield page, walk.offset(page), status_code, data
+                    return
+                more = walk.advance(page, len(data))
+                yield page, walk.offset(page), status_code, data
+                if not more:
+                    return
+            else:
+                return
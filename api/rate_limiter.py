@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# used for any endpoint that hasnt been configured explicitly (brands list, token refresh)
+DEFAULT_RATE = float(os.getenv('RATE_LIMIT_DEFAULT_RATE', 10))
+DEFAULT_MAX_RATE = float(os.getenv('RATE_LIMIT_DEFAULT_MAX_RATE', 50))
+# how many times a 429 is waited out and resent before the response is handed back
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 5))
+# pushback within this many seconds of the last decrease (or 1/rate if longer) is the same
+# overload, so requests that were already in flight when it started dont each halve the rate again
+RATE_LIMIT_DECREASE_INTERVAL = float(os.getenv('RATE_LIMIT_DECREASE_INTERVAL', 1.0))
+# longest wait a reservation is priced at, callers queued beyond it share the last slot instead of
+# being spread out at a rate that may be gone by the time they send
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 10.0))
+# statuses that mean the server wants fewer requests, other 5xx are failures, not a rate signal
+PUSHBACK_STATUSES = (429, 503)
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an http date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# token bucket whose refill rate grows by `step` on every success and halves on pushback (AIMD)
+class TokenBucket:
+    def __init__(self, rate, max_rate, min_rate=None, burst=None, step=None, decrease_interval=RATE_LIMIT_DECREASE_INTERVAL, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.rate = float(rate)
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min_rate) if min_rate else min(self.rate, 0.2)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self.step = float(step) if step else self.max_rate / 50
+        self.decrease_interval = decrease_interval
+        self.max_wait = max_wait
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.decreased_at = None
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        # takes a token and returns how long the caller has to wait before using it, the sleep is
+        # left to the caller so the same bucket works for threads (time.sleep) and asyncio.sleep
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = max(self.tokens - 1, -self.rate * self.max_wait)
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def on_success(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.step)
+                self.burst = max(1.0, self.rate)
+
+    def on_throttle(self, retry_after=None):
+        # returns True when the rate was lowered, False when this pushback belongs to the one
+        # that last lowered it
+        with self.lock:
+            now = time.monotonic()
+            lowered = self.decreased_at is None or now - self.decreased_at >= max(self.decrease_interval, 1 / self.rate)
+            if lowered:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.burst = max(1.0, self.rate)
+                self.decreased_at = now
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, now + pause)
+            # drop whatever was saved up so callers restart from an empty bucket after the pause
+            self.tokens = min(self.tokens, 0.0)
+            self.updated_at = max(self.updated_at, now)
+        return lowered
+
+class RateLimiter:
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, endpoint, rate, max_rate, **kwargs):
+        with self.lock:
+            self.buckets[endpoint] = TokenBucket(rate, max_rate, **kwargs)
+
+    def bucket(self, endpoint):
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            with self.lock:
+                bucket = self.buckets.setdefault(endpoint, TokenBucket(DEFAULT_RATE, DEFAULT_MAX_RATE))
+        return bucket
+
+    def record(self, endpoint, status_code, retry_after=None):
+        # 429s and 503s count as the server pushing back, other errors leave the rate alone and
+        # everything else lets it creep up
+        bucket = self.bucket(endpoint)
+        if status_code in PUSHBACK_STATUSES:
+            if bucket.on_throttle(parse_retry_after(retry_after)):
+                logger.warning(f"{endpoint} pushed back with status {status_code}; rate lowered to {bucket.rate:.2f}/s")
+        elif status_code < 500:
+            bucket.on_success()
+
+_rate_limiter = RateLimiter()
+
+def get_rate_limiter():
+    return _rate_limiter
@@ -0,0 +1,103 @@
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from urllib3.exceptions import NewConnectionError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# total tries for a request that keeps failing with a retryable error, the first one included
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 4))
+RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', 0.5))
+RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', 10))
+# only resent when the request is safe to repeat (reads), see should_retry_status
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+# consecutive failures before an endpoint's circuit opens, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', 30))
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+def backoff_delay(attempt, retry_after=None):
+    # exponential backoff with full jitter, a server supplied Retry-After wins when it is longer
+    delay = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def should_retry_status(status_code, idempotent):
+    return idempotent and status_code in RETRYABLE_STATUSES
+
+def request_never_sent(exc):
+    # true when the connection failed before any bytes went out, so even a non-idempotent
+    # request like accept can be sent again without risking a double submit
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+def should_retry_exception(exc, idempotent):
+    if isinstance(exc, CircuitOpenError):
+        return False
+    return idempotent or request_never_sent(exc)
+
+# closed -> open after `threshold` consecutive failures -> one trial request after `reset_seconds`
+class CircuitBreaker:
+    def __init__(self, endpoint, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        # retries of a request already under way stop once another caller has opened the circuit
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"circuit open for {self.endpoint}, failing fast")
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"circuit for {self.endpoint} closed again")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or (self.opened_at is None and self.failures >= self.threshold):
+                logger.warning(f"circuit for {self.endpoint} opened after {self.failures} failures, failing fast for {self.reset_seconds}s")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(endpoint):
+    breaker = _circuit_breakers.get(endpoint)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = _circuit_breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return breaker
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from api.decoding import variants_from_rows
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# variant records are only the fields the accept decision reads, inventory included, and inventory
+# moves fast, so the whole page shares its short ttl
+VARIANT_CACHE_TTL = float(os.getenv('VARIANT_CACHE_TTL', 4 * 60))
+VARIANT_CACHE_SIZE = int(os.getenv('VARIANT_CACHE_SIZE', 5000))
+# optional on-disk tier that survives between runs, empty == memory only
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', '')
+RESPONSE_CACHE_DISK_SIZE = int(os.getenv('RESPONSE_CACHE_DISK_SIZE', 100000))
+
+# every this many writes the disk tier is trimmed back to its size bound
+DISK_EVICT_EVERY = 100
+
+class ResponseCache:
+    def __init__(self, ttl, max_entries, path=None, disk_max_entries=RESPONSE_CACHE_DISK_SIZE, load=None):
+        self.ttl = ttl
+        # rebuilds entries read back from the disk tier, which only stores plain JSON
+        self.load = load
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_writes = 0
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        max_age = self.ttl
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                fetched_at, data = entry
+                if now - fetched_at < max_age:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+            if self.conn is not None:
+                row = self.conn.execute("SELECT data, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] < max_age:
+                    with self.conn:
+                        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    data = json.loads(row[0])
+                    if self.load is not None:
+                        data = self.load(data)
+                    self._remember(key, row[1], data)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return data
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, data)
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, data, fetched_at, accessed_at) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(data), now, now),
+                    )
+                self.disk_writes += 1
+                if self.disk_writes % DISK_EVICT_EVERY == 0:
+                    self._evict_disk()
+
+    def invalidate(self, prefix):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM responses WHERE substr(key, 1, length(?)) = ?", (prefix, prefix))
+
+    def _remember(self, key, fetched_at, data):
+        self.entries[key] = (fetched_at, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _evict_disk(self):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "entries": len(self.entries)}
+
+variant_cache = ResponseCache(
+    ttl=VARIANT_CACHE_TTL,
+    max_entries=VARIANT_CACHE_SIZE,
+    path=RESPONSE_CACHE_PATH,
+    load=variants_from_rows,
+)
+
+def cache_key(endpoint, *parts):
+    return "|".join(str(part) for part in (endpoint, *parts))
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from api.metrics import metrics
+from id_set import CompactIdSet, RunIndex
+from orchestrator import log_dedup
+from eligibility import selector_rules
+from api.async_mapping_api import AsyncClient, get_product_mappings, get_product_variants, accept_item_mappings
+from process_mapping_accept import iter_brands, collect_item_mapping_ids, count_rejections, variant_rollup, count_accept_results, ACCEPT_BATCH_SIZE, ACCEPT_TARGET
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+async def unless_stopped(awaitable, stop, poll=0.2):
+    # the result of `awaitable`, or None when the stop event got set first and it was cancelled
+    task = asyncio.ensure_future(awaitable)
+    if stop is None:
+        return await task
+    while not task.done():
+        if stop.is_set():
+            task.cancel()
+            # waits for the cancellation to go through so the CancelledError is consumed, not logged
+            await asyncio.gather(task, return_exceptions=True)
+            return None
+        await asyncio.wait({task}, timeout=poll)
+    return task.result()
+
+async def process_mapping_accept_async(get_brands_fn, client=None, index=None, stop=None):
+    # same flow and accounting as process_mapping_accept, but every product's variants are
+    # requested at once on the event loop and throttled by the client's per-endpoint limits.
+    # once the `stop` event is set the brand in progress is cancelled and nothing more is sent. nothing
+    # here is kept between runs, so the next run collects the ids again
+    if client is None:
+        async with AsyncClient() as client:
+            return await process_mapping_accept_async(get_brands_fn, client, index, stop)
+    index = index or RunIndex()
+    rules = selector_rules(get_brands_fn)
+
+    # brand selectors are still sync, so the brands stream is drained on a worker thread
+    brands = await asyncio.to_thread(lambda: list(iter_brands(get_brands_fn())))
+    if not brands:
+        logger.error("No brands data found.")
+        return
+
+    # every brand's ids are held until the accept phase, deduplicated and packed
+    all_item_mapping_ids = CompactIdSet()
+
+    for brand in brands:
+        if stop is not None and stop.is_set():
+            logger.info("Stop requested, not starting the remaining brands")
+            break
+        brand_id = brand.get("id")
+        brand_name = brand.get('name')
+        if not brand_id:
+            logger.warning("Brand missing id, skipping")
+            continue
+        if not index.claim_brand(brand_id):
+            logger.info(f"Brand {brand_name} ({brand_id}) already processed in this run, skipping")
+            continue
+
+        brand_rules = rules.for_brand(brand)
+        logger.info(f"Processing brand {brand_name} ({brand_id})")
+
+        product_mappings = await unless_stopped(get_product_mappings(client, brand_id, brand_name), stop)
+        if product_mappings is None:
+            logger.info(f"Stop requested, cancelled {brand_name} ({brand_id})")
+            break
+        if not product_mappings:
+            logger.warning(f"No product mappings data found for {brand_name} ({brand_id})")
+            continue
+
+        product_ids = []
+        for product in product_mappings:
+            product_id = product.id
+            if not product_id:
+                logger.warning("Product mapping entry missing id. Skipping product")
+                continue
+            if not index.claim_product(product_id):
+                continue
+            product_ids.append(product_id)
+        metrics.inc("products_scanned_total", len(product_ids), brand=brand_name)
+
+        results = await unless_stopped(asyncio.gather(*(get_product_variants(client, product_id) for product_id in product_ids)), stop)
+        if results is None:
+            logger.info(f"Stop requested, cancelled {brand_name} ({brand_id})")
+            break
+        for product_id, variants in zip(product_ids, results):
+            logger.debug("Processing product mapping id: %s", product_id)
+            if not variants:
+                logger.warning("No variants data found for product id: %s", product_id)
+                variant_rollup.add(brand_name, products=1)
+                continue
+
+            counts = {}
+            item_mapping_ids = collect_item_mapping_ids(product_id, variants, counts, brand_rules)
+            variant_rollup.add(brand_name, products=1, variants=len(variants), **counts)
+            metrics.inc("variants_scanned_total", len(variants), brand=brand_name)
+            metrics.inc("variants_filtered_total", len(variants) - len(item_mapping_ids), brand=brand_name)
+            count_rejections(brand_name, counts)
+            metrics.inc("ids_collected_total", len(item_mapping_ids), brand=brand_name)
+            all_item_mapping_ids.update(index.claim_item_mappings(item_mapping_ids))
+        variant_rollup.flush(brand_name)
+
+    total_items = len(all_item_mapping_ids)
+    accepted_count = 0
+
+    if total_items:
+        logger.info(f"Total collected itemMapping ids: {total_items} for {brand_name} ({brand_id})")
+        for batch_ids in all_item_mapping_ids.batches(ACCEPT_BATCH_SIZE):
+            if accepted_count >= ACCEPT_TARGET:
+                logger.info(f"Reached target of {ACCEPT_TARGET} accepted items; stopping further accepts")
+                break
+            if stop is not None and stop.is_set():
+                logger.info("Stop requested, leaving the remaining itemMapping ids for the next run")
+                break
+
+            logger.info("Accepting batch of %d itemMapping ids", len(batch_ids))
+            logger.debug("Accept batch ids: %s", tuple(batch_ids))
+            accept_response = await accept_item_mappings(client, batch_ids)
+            if accept_response:
+                logger.debug("Accept response: %s", accept_response)
+                successes, failures = count_accept_results(accept_response)
+                accepted_count += successes
+                # batches here mix every brand's ids, so they cant be credited to a single brand
+                metrics.inc("ids_accepted_total", successes, brand="all")
+                logger.info("Batch result: %d succeeded, %d failed; total accepted: %d", successes, failures, accepted_count)
+            else:
+                metrics.inc("accept_batches_failed_total", brand="all")
+                logger.error("Failed to accept batch of %d itemMapping ids", len(batch_ids))
+                logger.debug("Failed batch ids: %s", tuple(batch_ids))
+    else:
+        logger.warning("No itemMapping ids collected for acceptance")
+
+async def run_async(brand_functions, index=None, stop=None):
+    # one session and one dedup index for the whole run so connections are reused and a brand
+    # returned by more than one selector is only processed once
+    index = index or RunIndex()
+    async with AsyncClient() as client:
+        for fn in brand_functions:
+            if stop is not None and stop.is_set():
+                break
+            await process_mapping_accept_async(fn, client, index, stop)
+    log_dedup(index)
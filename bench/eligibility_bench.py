@@ -0,0 +1,73 @@
+import sys
+import random
+import timeit
+import logging
+import argparse
+
+# microseconds per RuleSet.evaluate call at a few product sizes, against the hand written check the
+# rules replaced:
+#   python -m bench.eligibility_bench --sizes 1 8 50 500 5000
+# "loop" is a bare inventory > 6 and all information provided filter, "old" the per-variant check the
+# rules replaced with its counters and debug lines, "rules" the default RuleSet as process_brand calls
+# it and "columns" the same RuleSet forced onto the column path (numpy when installed)
+
+from bench.run_bench import REPO_ROOT
+
+logger = logging.getLogger(__name__)
+
+def make_variants(rng, count):
+    from api.decoding import Variant
+    return [
+        Variant("%024x" % rng.getrandbits(96), rng.randint(0, 20), "%024x" % rng.getrandbits(96) if rng.random() < 0.9 else None, rng.random() < 0.8)
+        for _ in range(count)
+    ]
+
+def bare_loop(variants):
+    return [variant.item_mapping_id for variant in variants if variant.inventory_amount > 6 and variant.all_information_provided and variant.item_mapping_id]
+
+def old_check(variants, product_id="bench"):
+    item_mapping_ids = []
+    collected = not_ready = low_inventory = 0
+    for variant in variants:
+        inventory = variant.inventory_amount
+        if inventory > 6:
+            item_mapping_id = variant.item_mapping_id
+            all_info_provided = variant.all_information_provided
+            if item_mapping_id and all_info_provided:
+                item_mapping_ids.append(item_mapping_id)
+                collected += 1
+                logger.debug("Collected itemMapping id: %s from a variant with inventory %s", item_mapping_id, inventory)
+            elif not all_info_provided:
+                not_ready += 1
+                logger.debug("Variant in product id %s isnt ready for import", product_id)
+        else:
+            low_inventory += 1
+            logger.debug("Skipping variant in product id %s because inventory is %s", product_id, inventory)
+    return item_mapping_ids, {"collected": collected, "not_ready": not_ready, "low_inventory": low_inventory}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 8, 50, 500, 5000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, REPO_ROOT)
+    import eligibility
+    from eligibility import RuleSet
+
+    rules = RuleSet()
+    rng = random.Random(args.seed)
+    print(f"numpy: {'yes' if eligibility.numpy is not None else 'no'}")
+    print(f"{'variants':>9} {'loop us':>9} {'old us':>9} {'rules us':>9} {'columns us':>11}")
+    for size in args.sizes:
+        variants = make_variants(rng, size)
+        assert rules.evaluate(variants)[0] == rules.evaluate_columns(variants)[0] == old_check(variants)[0] == bare_loop(variants)
+        number = max(10, 200000 // size)
+        timings = [
+            min(timeit.repeat(lambda: fn(variants), number=number, repeat=9)) / number * 1e6
+            for fn in (bare_loop, old_check, rules.evaluate, rules.evaluate_columns)
+        ]
+        print(f"{size:>9} {timings[0]:>9.2f} {timings[1]:>9.2f} {timings[2]:>9.2f} {timings[3]:>11.2f}")
+
+if __name__ == "__main__":
+    main()
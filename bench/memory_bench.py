@@ -0,0 +1,95 @@
+import sys
+import json
+import random
+import argparse
+import subprocess
+
+# peak RSS per 10k variants held in memory, old full-dict pages against projected records:
+#   python -m bench.memory_bench --variants 100000
+# "dicts" keeps every decoded variant dict and a list of id strings the way the crawl used to,
+# "records" decodes through api.decoding into Variant records and keeps ids in a CompactIdSet.
+# each mode runs in its own process so the peaks dont mix
+
+from bench.run_bench import REPO_ROOT, peak_rss_mb
+
+PAGE_SIZE = 50
+
+def object_id(rng):
+    return "%024x" % rng.getrandbits(96)
+
+def variant_page(rng, product_id):
+    # shaped like a real variants page: the handful of fields the bot reads plus the usual catalogue payload
+    data = []
+    for j in range(PAGE_SIZE):
+        data.append({
+            "id": object_id(rng),
+            "productId": product_id,
+            "sku": f"SKU-{rng.getrandbits(40):x}",
+            "barcode": str(rng.getrandbits(48)),
+            "title": f"Bench variant {j} / size {rng.choice(['XS', 'S', 'M', 'L', 'XL'])}",
+            "options": [{"name": "Size", "value": rng.choice(['XS', 'S', 'M', 'L', 'XL'])}, {"name": "Color", "value": "Black"}],
+            "price": {"amount": rng.randint(1000, 20000), "currency": "USD"},
+            "compareAtPrice": {"amount": rng.randint(1000, 20000), "currency": "USD"},
+            "images": [f"https://cdn.example.com/{object_id(rng)}.jpg" for _ in range(3)],
+            "inventoryAmount": rng.randint(0, 20),
+            "weight": {"value": rng.random(), "unit": "kg"},
+            "createdAt": "2024-01-01T00:00:00.000Z",
+            "updatedAt": "2024-06-01T00:00:00.000Z",
+            "itemMapping": {
+                "id": object_id(rng),
+                "status": "PENDING",
+                "allInformationForImportProvided": rng.random() < 0.8,
+                "missingFields": [],
+                "createdAt": "2024-01-01T00:00:00.000Z",
+            },
+        })
+    return json.dumps({"data": data}).encode()
+
+def run_mode(mode, variants, seed):
+    # runs inside the child process started by main, returns (baseline MB, peak MB)
+    sys.path.insert(0, REPO_ROOT)
+    from api.decoding import decode_data, project_variant
+    from id_set import CompactIdSet
+
+    rng = random.Random(seed)
+    variant_page(rng, "warmup")
+    baseline = peak_rss_mb()
+
+    held = []
+    ids = [] if mode == "dicts" else CompactIdSet()
+    for page in range(variants // PAGE_SIZE):
+        content = variant_page(rng, object_id(rng))
+        if mode == "dicts":
+            data = json.loads(content)["data"]
+            held.extend(data)
+            ids.extend(v["itemMapping"]["id"] for v in data if v["inventoryAmount"] > 6 and v["itemMapping"]["allInformationForImportProvided"])
+        else:
+            data = decode_data(content, project_variant)
+            held.extend(data)
+            ids.update(v.item_mapping_id for v in data if v.inventory_amount > 6 and v.all_information_provided)
+    return baseline, peak_rss_mb(), len(ids)
+
+def main():
+    parser = argparse.ArgumentParser(description="peak RSS per 10k variants held by the crawl")
+    parser.add_argument("--variants", type=int, default=100000)
+    parser.add_argument("--modes", nargs="+", choices=["dicts", "records"], default=["dicts", "records"])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--worker", choices=["dicts", "records"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_mode(args.worker, args.variants, args.seed)))
+        return
+
+    print(f"{'mode':>8} {'variants':>9} {'ids':>8} {'held MB':>8} {'MB/10k':>7}")
+    for mode in args.modes:
+        completed = subprocess.run(
+            [sys.executable, "-m", "bench.memory_bench", "--worker", mode, "--variants", str(args.variants), "--seed", str(args.seed)],
+            cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True, check=True,
+        )
+        baseline, peak, id_count = json.loads(completed.stdout.strip().splitlines()[-1])
+        held = peak - baseline
+        print(f"{mode:>8} {args.variants:>9} {id_count:>8} {held:>8.1f} {held / (args.variants / 10000):>7.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from api.brands_api import BRANDS_LIST_PATH
+from api.mapping_api import PRODUCT_MAPPINGS_PATH, PRODUCT_MAPPING_VARIANTS_PATH, ACCEPT_MAPPING_PATH
+
+# local stand-in for the Flip admin api, only implements what the bot calls:
+#   python -m bench.mock_flip_api --brands 4 --products 500 --variants 8 --latency 20
+# GET /stats returns request counts by endpoint and status plus the accepted ids, ?reset=1 clears them
+
+DEFAULT_REFRESH_TOKEN_PATH = '/auth/refresh'
+VARIANTS_PATTERN = re.compile("^" + re.escape(PRODUCT_MAPPING_VARIANTS_PATH).replace(re.escape("{product_id}"), "([^/]+)") + "$")
+
+class MockFlipState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.brands = [{"id": f"brand-{i}", "name": f"Bench Brand {i}"} for i in range(args.brands)]
+        self.token_count = 0
+        # access token -> expiresAt in ms
+        self.tokens = {}
+        # endpoint -> [window start, requests in window]
+        self.windows = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.accepted = []
+
+    def count(self, endpoint, status):
+        with self.lock:
+            by_status = self.requests.setdefault(endpoint, {})
+            by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    def issue_token(self):
+        with self.lock:
+            self.token_count += 1
+            token = f"bench-token-{self.token_count}"
+            expires_at = int((time.time() + self.args.token_ttl) * 1000)
+            self.tokens[token] = expires_at
+        return token, expires_at
+
+    def token_valid(self, authorization):
+        token = (authorization or "").removeprefix("Bearer ")
+        expires_at = self.tokens.get(token)
+        return expires_at is not None and time.time() * 1000 < expires_at
+
+    def over_rate_limit(self, endpoint):
+        # fixed one second windows per endpoint, enough to exercise the bot's 429 handling
+        if not self.args.rate_limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault(endpoint, [now, 0])
+            if now - window[0] >= 1:
+                window[0], window[1] = now, 0
+            window[1] += 1
+            return window[1] > self.args.rate_limit
+
+    def variants(self, product_id, page, limit):
+        # deterministic per product: a spread of inventory and readiness, optionally some null itemMappings
+        rng = random.Random(product_id)
+        variants = []
+        for j in range(self.args.variants):
+            item_mapping = None
+            if rng.random() >= self.args.null_mapping_rate:
+                item_mapping = {"id": f"{product_id}-im{j}", "allInformationForImportProvided": rng.random() < 0.8}
+            variants.append({"id": f"{product_id}-v{j}", "inventoryAmount": rng.randint(0, 20), "itemMapping": item_mapping})
+        return variants[(page - 1) * limit:page * limit]
+
+class MockFlipHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if not self.path.startswith("/stats"):
+            return self.respond(404, {})
+        state = self.state
+        with state.lock:
+            stats = {
+                "requests": state.requests,
+                "total_requests": sum(sum(by_status.values()) for by_status in state.requests.values()),
+                "accepted": len(state.accepted),
+                "unique_accepted": len(set(state.accepted)),
+            }
+        if "reset=1" in self.path:
+            state.reset()
+        self.respond(200, stats)
+
+    def do_POST(self):
+        args = self.state.args
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        endpoint, handler = self.route()
+        if handler is None:
+            return self.respond(404, {}, endpoint)
+
+        if args.latency:
+            time.sleep(max(0.0, random.gauss(args.latency, args.latency * args.jitter)) / 1000)
+        if self.state.over_rate_limit(endpoint):
+            return self.respond(429, {"message": "Too Many Requests"}, endpoint, {"Retry-After": "1"})
+        if endpoint != args.refresh_token_path and not self.state.token_valid(self.headers.get("Authorization")):
+            return self.respond(401, {"message": "Unauthorized"}, endpoint)
+        # accept is never retried after a 502 by the bot, so injected errors stay on the reads
+        if endpoint not in (args.refresh_token_path, ACCEPT_MAPPING_PATH) and random.random() < args.error_rate:
+            return self.respond(502, {"message": "Bad Gateway"}, endpoint)
+        # a limit over --max-page-size is either refused or quietly served at the cap, like real APIs do
+        limit = body.get("limit")
+        if args.max_page_size and isinstance(limit, int) and limit > args.max_page_size:
+            if args.oversize == "reject":
+                return self.respond(400, {"message": f"limit must not be greater than {args.max_page_size}"}, endpoint)
+            body["limit"] = args.max_page_size
+        handler(endpoint, body)
+
+    def route(self):
+        path = self.path.split("?")[0]
+        if path == self.state.args.refresh_token_path:
+            return path, self.refresh
+        if path == BRANDS_LIST_PATH:
+            return path, self.brands_list
+        if path == PRODUCT_MAPPINGS_PATH:
+            return path, self.product_mappings
+        if path == ACCEPT_MAPPING_PATH:
+            return path, self.accept
+        match = VARIANTS_PATTERN.match(path)
+        if match:
+            self.product_id = match.group(1)
+            return PRODUCT_MAPPING_VARIANTS_PATH, self.product_variants
+        return path, None
+
+    def refresh(self, endpoint, body):
+        token, expires_at = self.state.issue_token()
+        self.respond(200, {"data": {"auth": {"accessToken": token, "expiresAt": expires_at}}}, endpoint)
+
+    def brands_list(self, endpoint, body):
+        brands = self.state.brands
+        if body.get("name"):
+            brands = [brand for brand in brands if brand["name"] == body["name"]]
+        self.respond(201, {"data": paginate(brands, body)}, endpoint)
+
+    def product_mappings(self, endpoint, body):
+        brand_id = body.get("itemBrandId")
+        page, limit = body.get("page", 1), body.get("limit", 50)
+        start = (page - 1) * limit
+        stop = min(page * limit, self.state.args.products)
+        data = [{"id": f"{brand_id}-p{i}", "itemBrandId": brand_id} for i in range(start, stop)]
+        self.respond(201, {"data": data}, endpoint)
+
+    def product_variants(self, endpoint, body):
+        data = self.state.variants(self.product_id, body.get("page", 1), body.get("limit", 50))
+        self.respond(201, {"data": data}, endpoint)
+
+    def accept(self, endpoint, body):
+        item_ids = body.get("itemIds") or []
+        with self.state.lock:
+            self.state.accepted.extend(item_ids)
+        self.respond(201, {"data": [{"id": item_id, "success": True} for item_id in item_ids], "errors": []}, endpoint)
+
+    def respond(self, status, payload, endpoint=None, headers=None):
+        if endpoint is not None:
+            self.state.count(endpoint, status)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def paginate(items, body):
+    page, limit = body.get("page", 1), body.get("limit", 50)
+    return items[(page - 1) * limit:page * limit]
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="local mock of the Flip admin api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--brands", type=int, default=2)
+    parser.add_argument("--products", type=int, default=100, help="products per brand")
+    parser.add_argument("--variants", type=int, default=8, help="variants per product")
+    parser.add_argument("--latency", type=float, default=0, help="mean added latency per request in ms")
+    parser.add_argument("--jitter", type=float, default=0.25, help="latency standard deviation as a fraction of --latency")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per second per endpoint before 429s, 0 == unlimited")
+    parser.add_argument("--token-ttl", type=float, default=3600, help="access token lifetime in seconds, expired tokens get 401")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 502, accept excluded")
+    parser.add_argument("--null-mapping-rate", type=float, default=0, help="fraction of variants whose itemMapping is null")
+    parser.add_argument("--max-page-size", type=int, default=0, help="largest page size served, 0 == unlimited")
+    parser.add_argument("--oversize", choices=["clamp", "reject"], default="clamp", help="what a larger limit gets, a clamped page or a 400")
+    parser.add_argument("--refresh-token-path", default=DEFAULT_REFRESH_TOKEN_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+def serve(args):
+    random.seed(args.seed)
+    handler = type("BoundMockFlipHandler", (MockFlipHandler,), {"state": MockFlipState(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"mock flip api listening on http://{args.host}:{server.server_port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    serve(build_parser().parse_args())
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import resource
+import subprocess
+import urllib.request
+
+# end-to-end throughput benchmark against bench/mock_flip_api.py, run from the repo root:
+#   python -m bench.run_bench --scales 2x100x8 4x500x8 --engines sync async --latency 20
+# every (scale, engine) pair gets a fresh mock server and a fresh bot process, so peak RSS and
+# request counts belong to that run alone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_scale(value):
+    # brands x products per brand x variants per product, e.g. 4x500x8
+    try:
+        brands, products, variants = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"scale must look like BRANDSxPRODUCTSxVARIANTS, got {value}")
+    return brands, products, variants
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def get_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as response:
+        return json.load(response)
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def start_mock(args, scale, port):
+    brands, products, variants = scale
+    command = [
+        sys.executable, "-m", "bench.mock_flip_api", "--port", str(port),
+        "--brands", str(brands), "--products", str(products), "--variants", str(variants),
+        "--latency", str(args.latency), "--rate-limit", str(args.rate_limit),
+        "--token-ttl", str(args.token_ttl), "--error-rate", str(args.error_rate),
+        "--null-mapping-rate", str(args.null_mapping_rate),
+        "--max-page-size", str(args.max_page_size), "--oversize", args.oversize,
+    ]
+    mock = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            get_stats(base_url)
+            return mock, base_url
+        except OSError:
+            if time.monotonic() > deadline or mock.poll() is not None:
+                mock.kill()
+                raise RuntimeError("mock flip api did not come up")
+            time.sleep(0.1)
+
+def bench_env(base_url, workdir):
+    registry_path = os.path.join(workdir, "brands.json")
+    with open(registry_path, "w") as file:
+        json.dump({"enabled": ["bench"], "brands": {"bench": {"filters": {}}}}, file)
+    env = dict(os.environ)
+    env.update({
+        "BASE_URL": base_url,
+        "REFRESH_TOKEN_PATH": "/auth/refresh",
+        "REFRESH_TOKEN": "bench",
+        "ACCESS_TOKEN_FILE_PATH": os.path.join(workdir, "token.json"),
+        "BRANDS_CONFIG_FILE": registry_path,
+        "BRAND_IDS_FILE": os.path.join(workdir, "brand_ids.json"),
+        # a cold run every time: no delta sync state, no disk cache, no metrics file
+        "STATE_DB_PATH": "",
+        "RESPONSE_CACHE_PATH": "",
+        "METRICS_TEXTFILE": "",
+        "PAGE_SIZES_FILE": "",
+    })
+    return env
+
+def run_one(args, scale, engine):
+    port = free_port()
+    mock, base_url = start_mock(args, scale, port)
+    try:
+        with tempfile.TemporaryDirectory(prefix="mappingbot-bench-") as workdir:
+            log_path = os.path.join(workdir, "bot.log")
+            with open(log_path, "w") as log_file:
+                completed = subprocess.run(
+                    [sys.executable, "-m", "bench.run_bench", "--worker", "--engine", engine],
+                    cwd=REPO_ROOT, env=bench_env(base_url, workdir), stdout=subprocess.PIPE, stderr=log_file, text=True,
+                )
+            if completed.returncode != 0:
+                with open(log_path) as log_file:
+                    tail = log_file.read()[-2000:]
+                raise RuntimeError(f"bot exited with {completed.returncode}:\n{tail}")
+            worker = json.loads(completed.stdout.strip().splitlines()[-1])
+        stats = get_stats(base_url)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    brands, products, variants = scale
+    accepted = stats["unique_accepted"]
+    return {
+        "scale": f"{brands}x{products}x{variants}",
+        "engine": engine,
+        "wall_seconds": round(worker["wall_seconds"], 3),
+        "ids_accepted": accepted,
+        "ids_per_second": round(accepted / worker["wall_seconds"], 1) if worker["wall_seconds"] else 0.0,
+        "requests": stats["total_requests"],
+        "requests_by_endpoint": stats["requests"],
+        "peak_rss_mb": round(worker["peak_rss_mb"], 1),
+    }
+
+def worker(engine):
+    # runs inside the bot process started by run_one, the last stdout line is the result
+    sys.path.insert(0, REPO_ROOT)
+    import main
+    from log_setup import setup_logging
+    setup_logging()
+    started_at = time.monotonic()
+    main.main(engine=engine)
+    print(json.dumps({"wall_seconds": time.monotonic() - started_at, "peak_rss_mb": peak_rss_mb()}))
+
+def print_table(results):
+    header = f"{'scale':>14} {'engine':>6} {'wall s':>8} {'ids':>7} {'ids/s':>8} {'requests':>9} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['scale']:>14} {result['engine']:>6} {result['wall_seconds']:>8.2f} {result['ids_accepted']:>7} "
+            f"{result['ids_per_second']:>8.1f} {result['requests']:>9} {result['peak_rss_mb']:>8.1f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end mappingbot throughput benchmark")
+    parser.add_argument("--scales", nargs="+", type=parse_scale, default=[parse_scale("2x100x8"), parse_scale("4x500x8")])
+    parser.add_argument("--engines", nargs="+", choices=["sync", "async"], default=["sync"])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=20, help="mean mock latency per request in ms")
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--token-ttl", type=float, default=3600)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--null-mapping-rate", type=float, default=0)
+    parser.add_argument("--max-page-size", type=int, default=0)
+    parser.add_argument("--oversize", choices=["clamp", "reject"], default="clamp")
+    parser.add_argument("--json", help="also write the results to this file, for comparing before and after a change")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", default="sync", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.engine)
+        return
+
+    results = []
+    for scale in args.scales:
+        for engine in args.engines:
+            for _ in range(args.repeat):
+                result = run_one(args, scale, engine)
+                results.append(result)
+                print(f"{result['scale']} {engine}: {result['ids_accepted']} ids in {result['wall_seconds']:.2f}s", file=sys.stderr, flush=True)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import os
+import operator
+from api.decoding import Variant
+from api.brands_api import normalize_brand_name
+
+# numpy is optional, without it the same rules run over plain tuples
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# products with at least this many variants are evaluated as numpy columns, below it converting the
+# records costs more than the rules themselves. see bench/eligibility_bench.py
+ELIGIBILITY_NUMPY_MIN_VARIANTS = int(os.getenv('ELIGIBILITY_NUMPY_MIN_VARIANTS', 50000))
+
+def is_set(value, _):
+    return bool(value)
+
+# rule name -> (Variant field it reads, test against the configured value). a variant is eligible
+# when it passes every enabled rule; rules run in this order and a rejected variant is counted
+# against the first one it fails
+RULES = {
+    "min_inventory": ("inventory_amount", operator.ge),
+    "max_inventory": ("inventory_amount", operator.le),
+    "has_item_mapping": ("item_mapping_id", is_set),
+    "all_information_provided": ("all_information_provided", operator.eq),
+}
+# what every brand gets unless brands.json overrides it, the old inventory > 6 and all information
+# provided check. null or false turns a rule off, has_item_mapping is always on since there is nothing to accept without it
+DEFAULT_RULES = {"min_inventory": 7, "max_inventory": None, "has_item_mapping": True, "all_information_provided": True}
+# numpy dtypes for the fields rules compare, anything else stays an object array
+COLUMN_DTYPES = {"inventory_amount": float, "all_information_provided": bool}
+
+def columns(variants):
+    # Variant records -> {field: values of every variant}, as numpy arrays when numpy is available
+    values = dict(zip(Variant._fields, zip(*variants)))
+    if numpy is None:
+        return values
+    return {
+        field: numpy.fromiter(column, dtype=COLUMN_DTYPES[field], count=len(column)) if field in COLUMN_DTYPES
+        else numpy.array(column, dtype=object)
+        for field, column in values.items()
+    }
+
+# the enabled rules for one brand, evaluated over all variants of a product at once
+class RuleSet:
+    def __init__(self, config=None):
+        config = {**DEFAULT_RULES, **(config or {})}
+        unknown = sorted(set(config) - RULES.keys())
+        if unknown:
+            raise ValueError(f"unknown eligibility rules: {unknown}")
+        config["has_item_mapping"] = True
+        self.rules = [
+            (name, *RULES[name], config[name])
+            for name in RULES
+            if config[name] is not None and config[name] is not False
+        ]
+        # the same rules with record positions instead of field names for the row path
+        self.checks = [(name, Variant._fields.index(field), test, value) for name, field, test, value in self.rules]
+
+    def __repr__(self):
+        return f"RuleSet({', '.join(f'{name}={value}' for name, _, _, value in self.rules)})"
+
+    def for_brand(self, brand):
+        # same rules for every brand, see BrandRules
+        return self
+
+    def evaluate(self, variants):
+        # returns (eligible itemMapping ids in variant order, {rule name: variants it rejected})
+        if numpy is not None and len(variants) >= ELIGIBILITY_NUMPY_MIN_VARIANTS:
+            return self.evaluate_columns(variants)
+        return self.evaluate_rows(variants)
+
+    def evaluate_rows(self, variants):
+        # each rule filters what the previous ones kept, no columns are built
+        rejected = {}
+        for name, index, test, value in self.checks:
+            if not variants:
+                break
+            if test is is_set:
+                kept = [variant for variant in variants if variant[index]]
+            else:
+                kept = [variant for variant in variants if test(variant[index], value)]
+            if len(kept) < len(variants):
+                rejected[name] = len(variants) - len(kept)
+            variants = kept
+        return [variant.item_mapping_id for variant in variants], rejected
+
+    def evaluate_columns(self, variants):
+        rejected = {}
+        if not variants:
+            return [], rejected
+        values = columns(variants)
+        if numpy is not None:
+            eligible = numpy.ones(len(variants), dtype=bool)
+            for name, field, test, value in self.rules:
+                column = values[field]
+                passed = column.astype(bool) if test is is_set else test(column, value)
+                passed = numpy.asarray(passed, dtype=bool)
+                count = int(numpy.count_nonzero(eligible & ~passed))
+                if count:
+                    rejected[name] = count
+                eligible &= passed
+            return values["item_mapping_id"][eligible].tolist(), rejected
+
+        eligible = [True] * len(variants)
+        for name, field, test, value in self.rules:
+            passed = [test(item, value) for item in values[field]]
+            count = sum(1 for keep, ok in zip(eligible, passed) if keep and not ok)
+            if count:
+                rejected[name] = count
+            eligible = [keep and ok for keep, ok in zip(eligible, passed)]
+        return [item_mapping_id for item_mapping_id, keep in zip(values["item_mapping_id"], eligible) if keep], rejected
+
+default_rules = RuleSet()
+
+# the RuleSet of each brand a selector returns. a brand with an entry of its own in brands.json gets
+# that entry's rules whichever selector reaches it first, every other brand gets the selector's rules
+class BrandRules:
+    def __init__(self, by_name=None, default=None):
+        # by_name maps normalized brand names to rule configs
+        self.by_name = {name: RuleSet(config) for name, config in (by_name or {}).items()}
+        self.default = default or default_rules
+
+    def for_brand(self, brand):
+        return self.by_name.get(normalize_brand_name(brand.get("name")), self.default)
+
+def selector_rules(get_brands_fn):
+    # BrandRules for a selector from brand_selectors, a plain callable gets the default rules
+    return BrandRules(getattr(get_brands_fn, "brand_rules", None), RuleSet(getattr(get_brands_fn, "rules", None)))
@@ -0,0 +1,95 @@
+import re
+import threading
+
+# flip ids are Mongo ObjectIds: 24 lowercase hex chars, which fit in a 96 bit int. packed ids get
+# bit 96 set so they can be told apart from ids that were ints to begin with
+_OBJECT_ID = re.compile(r"[0-9a-f]{24}")
+_PACKED = 1 << 96
+
+def pack_id(value):
+    if isinstance(value, str) and _OBJECT_ID.fullmatch(value):
+        return _PACKED | int(value, 16)
+    if isinstance(value, int) and value >> 96 == 1:
+        # an int id that happens to look packed is boxed so it stays distinct
+        return (value,)
+    return value
+
+def unpack_id(key):
+    if isinstance(key, int) and key >> 96 == 1:
+        return f"{key ^ _PACKED:024x}"
+    if isinstance(key, tuple):
+        return key[0]
+    return key
+
+# insertion ordered, deduplicating set of ids. ObjectIds are stored as ints, about a third smaller
+# than the str plus the list slot and set entry a list-and-set pair needs; any other id is kept as is
+class CompactIdSet:
+    __slots__ = ("_seen", "_order", "_lock")
+
+    def __init__(self, ids=()):
+        self._seen = set()
+        self._order = []
+        self._lock = threading.Lock()
+        self.update(ids)
+
+    def add(self, value):
+        # returns True when the id was new
+        key = pack_id(value)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            self._order.append(key)
+        return True
+
+    def update(self, values):
+        # returns the ids that were new, in order
+        return [value for value in values if self.add(value)]
+
+    def __contains__(self, value):
+        return pack_id(value) in self._seen
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return (unpack_id(key) for key in self._order)
+
+    def batches(self, size):
+        # lists of at most `size` ids without ever materialising the whole set as strings
+        for start in range(0, len(self._order), size):
+            yield [unpack_id(key) for key in self._order[start:start + size]]
+
+# run-wide record of which brands, products and itemMapping ids were already taken on, shared by
+# every selector in a run so a brand returned by two selectors is crawled and accepted only once
+class RunIndex:
+    def __init__(self):
+        self.brands = CompactIdSet()
+        self.products = CompactIdSet()
+        self.item_mappings = CompactIdSet()
+        self.duplicates = {"brands": 0, "products": 0, "item_mappings": 0}
+        self.lock = threading.Lock()
+
+    def _count(self, kind, count):
+        if count:
+            with self.lock:
+                self.duplicates[kind] += count
+
+    def claim_brand(self, brand_id):
+        # True for the first caller only
+        if self.brands.add(brand_id):
+            return True
+        self._count("brands", 1)
+        return False
+
+    def claim_product(self, product_id):
+        if self.products.add(product_id):
+            return True
+        self._count("products", 1)
+        return False
+
+    def claim_item_mappings(self, item_mapping_ids):
+        # returns the ids no one in this run has claimed yet, in order
+        new_ids = self.item_mappings.update(item_mapping_ids)
+        self._count("item_mappings", len(item_mapping_ids) - len(new_ids))
+        return new_ids
@@ -0,0 +1,115 @@
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# "json" writes one object per line, "text" the old human readable lines
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# seconds between rolled up summary lines for the per-variant hot path
+LOG_ROLLUP_SECONDS = float(os.getenv('LOG_ROLLUP_SECONDS', 10))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# attributes every LogRecord has, anything else on a record came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class LazyQueueHandler(QueueHandler):
+    # the stock QueueHandler formats the message on the calling thread, this one hands the
+    # record over as is so %-style messages are only formatted on the listener thread.
+    # callers must pass immutable args (strings, numbers, tuples), which every log call here does
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            # tracebacks hold frames that keep changing, render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listener = None
+_listener_lock = threading.Lock()
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    # replaces whatever basicConfig installed at import time with one queue handler on the root
+    # logger, a single listener thread does the formatting and the writing
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.handlers[:] = [LazyQueueHandler(log_queue)]
+        root.setLevel(level)
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+def stop_logging():
+    # flushes everything still queued, safe to call more than once
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+# per-key counters that are logged as one summary line every `interval` seconds instead of
+# one line per event, e.g. a line per brand with how many variants were collected or skipped
+class RollupLog:
+    def __init__(self, logger, label, interval=LOG_ROLLUP_SECONDS):
+        self.logger = logger
+        self.label = label
+        self.interval = interval
+        self.counts = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, key, **counts):
+        with self.lock:
+            totals = self.counts.setdefault(key, {})
+            for name, value in counts.items():
+                totals[name] = totals.get(name, 0) + value
+            due = time.monotonic() - self.last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self, key=None):
+        # key=None logs every pending key, otherwise only that one (e.g. when a brand finishes)
+        with self.lock:
+            if key is None:
+                pending, self.counts = self.counts, {}
+                self.last_flush = time.monotonic()
+            else:
+                pending = {key: self.counts.pop(key)} if key in self.counts else {}
+        for key, totals in pending.items():
+            summary = ", ".join(f"{value} {name}" for name, value in totals.items())
+            self.logger.info("%s for %s: %s", self.label, key, summary, extra={"rollup": self.label, "key": key, **totals})
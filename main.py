@@ -1,42 +1,86 @@
-from api.brands_api import *
-from process_mapping_accept import process_mapping_accept
-
-def main():
-
-    brand_functions = [
-        # get_shopify_connected_brands,
-        # get_italist_brands,
-        # get_culture_kings_brands,
-        # get_princess_polly,
-        # get_refinery_no_1,
-        # get_rustic_marlin,
-        # get_uniikpillows,
-        # get_doghugscat,
-        # get_lapopart,
-        # get_liberal_repellent,
-        # get_belt_rhinestone,
-        # get_thirdlove,
-        # get_harpro,
-        # get_galaxy_by_harvic,
-        # get_mothersgold,
-        # get_tictoc,
-        # get_petlife,
-        # get_lauren_g_adams,
-        # get_moonlight_makers,
-        # get_bayeas,
-        # get_pipa_fine_art,
-        # get_onetify,
-        # get_mnml,
-        # get_moomaya,
-        # get_leg_avenue,
-        # get_directdeals,
-        # get_anna_kaci,
-        # get_fine_color_jewels,
-        get_fc_design,
-    ]
-
-    for fn in brand_functions:
-        process_mapping_accept(fn)
+import os
+import time
+import signal
+import logging
+import argparse
+import threading
+from api.brands_api import brand_selectors
+from api.http_client import get_transport
+from api.metrics import write_textfile, start_http_server
+from orchestrator import run_brands
+from log_setup import setup_logging
+from id_set import RunIndex
+
+logger = logging.getLogger(__name__)
+
+# "sync" runs process_mapping_accept, "async" runs the asyncio engine in async_process_mapping_accept
+ENGINE = os.getenv('MAPPINGBOT_ENGINE', 'sync')
+# seconds between the start of one daemon cycle and the next, same cadence launchd used
+DAEMON_INTERVAL = float(os.getenv('DAEMON_INTERVAL', 120))
+
+def main(engine=ENGINE, brands=None, stop=None):
+    # brands are picked in brands.json ("enabled") or passed as registry keys, e.g. ["princess_polly", "fc_design"].
+    # setting the `stop` event winds the run down early, see run_daemon
+    brand_functions = brand_selectors(keys=brands)
+    # one dedup index across every selector, so a brand two selectors return is only crawled once
+    index = RunIndex()
+
+    try:
+        if engine == "async":
+            import asyncio
+            from async_process_mapping_accept import run_async
+            asyncio.run(run_async(brand_functions, index, stop))
+            return
+
+        # brands run in parallel under one request budget, BRAND_WORKERS=1 processes them one at a time
+        return run_brands(brand_functions, index=index, stop=stop)
+    finally:
+        # counters keep growing across daemon cycles, so the file always holds the totals since startup
+        write_textfile()
+
+def run_daemon(interval=DAEMON_INTERVAL, engine=ENGINE, brands=None):
+    # stays resident so the connection pool, access token and caches stay warm between cycles.
+    # cycles run back to back on this thread so they can never overlap, a cycle that takes longer
+    # than the interval is followed straight away by the next one. a signal stops the cycle in progress
+    # too: no new brands start and running crawls end after the product in hand, well inside the
+    # 20s launchd waits before it sends SIGKILL. interrupted brands resume next run
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping the current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    metrics_server = start_http_server()
+
+    cycle = 0
+    while not stop.is_set():
+        cycle += 1
+        started_at = time.monotonic()
+        logger.info(f"Starting cycle {cycle}")
+        try:
+            main(engine=engine, brands=brands, stop=stop)
+        except Exception:
+            logger.exception(f"Cycle {cycle} failed")
+        elapsed = time.monotonic() - started_at
+        logger.info(f"Finished cycle {cycle} in {elapsed:.1f}s")
+        stop.wait(max(0.0, interval - elapsed))
+
+    if metrics_server:
+        metrics_server.shutdown()
+    get_transport().close()
+    logger.info("Daemon stopped")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["sync", "async"], default=ENGINE)
+    parser.add_argument("--brands", nargs="+", help="registry keys from brands.json to run instead of its enabled list")
+    parser.add_argument("--daemon", action="store_true", help="stay resident and run a cycle every --interval seconds")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL)
+    args = parser.parse_args()
+    setup_logging()
+    if args.daemon:
+        run_daemon(interval=args.interval, engine=args.engine, brands=args.brands)
+    else:
+        main(engine=args.engine, brands=args.brands)
@@ -0,0 +1,98 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from process_mapping_accept import process_brand, iter_brands, resume_pending, log_cache_stats, AcceptStage, AcceptTarget, VARIANT_CONCURRENCY
+from state_store import get_state_store
+from id_set import RunIndex
+from eligibility import selector_rules
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# brands processed at the same time. every brand keeps at most VARIANT_CONCURRENCY products in flight, so
+# one huge brand only ever holds one worker and its own share of the global HTTP_MAX_IN_FLIGHT budget
+BRAND_WORKERS = int(os.getenv('BRAND_WORKERS', 4))
+
+def run_brands(brand_functions, workers=BRAND_WORKERS, variant_concurrency=VARIANT_CONCURRENCY, state=None, index=None, stop=None):
+    # fans every brand from every selector out to a worker pool, brands are queued in the order the
+    # selectors stream them so small brands keep moving on the other workers while a big one runs.
+    # a brand several selectors return is only queued the first time. like process_mapping_accept,
+    # the ACCEPT_TARGET cap applies per selector so one busy selector cant starve the ones after it.
+    # once the `stop` event is set no more brands are queued and the running ones wind down early
+    state = state or get_state_store()
+    index = index or RunIndex()
+    futures = []
+    if state:
+        resume_pending(state, AcceptTarget(), index)
+
+    # one accept stage for the whole run, every brand's crawl feeds it through the same bounded queue
+    accept_stage = AcceptStage(stop=stop)
+    stopping = lambda: stop is not None and stop.is_set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="brand") as executor:
+            for fn in brand_functions:
+                if stopping():
+                    break
+                rules = selector_rules(fn)
+                target = AcceptTarget()
+                for brand in iter_brands(fn()):
+                    if target.reached or stopping():
+                        break
+                    if brand.get("id") and not index.claim_brand(brand["id"]):
+                        logger.info(f"Brand {brand.get('name')} ({brand['id']}) from {fn.__name__} already queued in this run, skipping")
+                        continue
+                    futures.append((brand, executor.submit(process_brand, brand, target, state, variant_concurrency, accept_stage, index, rules, stop)))
+    finally:
+        accept_stage.close()
+
+    # every brand got to the end, so there is nothing left to resume
+    if state and not stopping():
+        state.finish_run()
+
+    summaries = []
+    for brand, future in futures:
+        try:
+            summary = future.result()
+        except Exception:
+            logger.exception(f"Brand {brand.get('name')} ({brand.get('id')}) failed")
+            summary = {"brand_id": brand.get("id"), "brand_name": brand.get("name"), "error": True}
+        if summary:
+            summaries.append(summary)
+
+    if not summaries:
+        logger.error("No brands data found.")
+        return summaries
+
+    log_summary(summaries)
+    log_dedup(index)
+    log_cache_stats()
+    return summaries
+
+def log_summary(summaries):
+    logger.info(f"Run summary for {len(summaries)} brands:")
+    for summary in summaries:
+        if summary.get("error"):
+            logger.info(f"  {summary['brand_name']} ({summary['brand_id']}): failed, see errors above")
+            continue
+        logger.info(
+            f"  {summary['brand_name']} ({summary['brand_id']}): "
+            f"{summary['products_seen']} products ({summary['products_skipped']} unchanged), "
+            f"{summary['collected']} collected, {summary['accepted']} accepted, "
+            f"{summary['failed_batches']} failed batches in {summary['elapsed']:.1f}s"
+        )
+        if summary.get("failed_page"):
+            logger.warning(f"  {summary['brand_name']} ({summary['brand_id']}): crawl stopped at product page {summary['failed_page']}, resumes next run")
+        if summary.get("stopped"):
+            logger.warning(f"  {summary['brand_name']} ({summary['brand_id']}): stopped early, resumes next run")
+        if summary.get("truncated_at"):
+            logger.warning(f"  {summary['brand_name']} ({summary['brand_id']}): crawl hit the page cap after {summary['truncated_at']} products")
+    total_accepted = sum(summary.get("accepted", 0) for summary in summaries)
+    logger.info(f"  total accepted: {total_accepted}")
+
+def log_dedup(index):
+    duplicates = index.duplicates
+    if any(duplicates.values()):
+        logger.info(
+            f"Skipped duplicates in this run: {duplicates['brands']} brands, "
+            f"{duplicates['products']} products, {duplicates['item_mappings']} itemMapping ids"
+        )
@@ -1,97 +1,524 @@
+import os
 import time
+import queue
 import logging
-from api.mapping_api import get_product_mappings, get_product_variants, accept_item_mappings
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from api.mapping_api import iter_product_mapping_pages, get_product_variants, post_accept_item_mappings
+from api.response_cache import variant_cache
+from api.metrics import metrics
+from state_store import get_state_store, variant_fingerprint
+from log_setup import RollupLog
+from id_set import RunIndex
+from eligibility import default_rules, selector_rules
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def process_mapping_accept(get_brands_fn):
-    brands_response = get_brands_fn()
-    if not brands_response or "data" not in brands_response:
-        logger.error("No brands data found.")
+# number of products whose variant pages are fetched at the same time, 1 == old serial behaviour
+VARIANT_CONCURRENCY = int(os.getenv('VARIANT_CONCURRENCY', 8))
+# brand ids or names whose variant pages always bypass the response cache, comma separated
+CACHE_REFRESH_BRANDS = {name.strip() for name in os.getenv('CACHE_REFRESH_BRANDS', '').split(',') if name.strip()}
+# starting accept batch size, AdaptiveBatchSize moves it between 1 and ACCEPT_MAX_BATCH_SIZE
+ACCEPT_BATCH_SIZE = 30
+ACCEPT_MAX_BATCH_SIZE = int(os.getenv('ACCEPT_MAX_BATCH_SIZE', 100))
+# an accept call slower than this counts as the endpoint struggling and shrinks the batch
+ACCEPT_LATENCY_TARGET = float(os.getenv('ACCEPT_LATENCY_TARGET', 2.0))
+ACCEPT_TARGET = 10000
+# accept calls run on their own threads while the crawl keeps going, the crawl blocks once this many
+# full batches are waiting so neither stage runs away from the other
+ACCEPT_WORKERS = int(os.getenv('ACCEPT_WORKERS', 2))
+ACCEPT_QUEUE_SIZE = int(os.getenv('ACCEPT_QUEUE_SIZE', 10))
+# a pending id that has gone out this many times without the server confirming or refusing it is
+# dropped instead of being resent every cycle. it is not marked accepted, so it is collected again
+# the next time its product is crawled
+ACCEPT_MAX_ATTEMPTS = int(os.getenv('ACCEPT_MAX_ATTEMPTS', 5))
+
+# per-variant outcomes are counted and logged as one line per brand every LOG_ROLLUP_SECONDS
+variant_rollup = RollupLog(logger, "variants")
+
+def fetch_variants(product_id, refresh=False):
+    # returns (variants, page that failed or None), variants stop short of a failed page
+    outcome = {"failed_page": None}
+    variants = get_product_variants(product_id, refresh, outcome)
+    return variants, outcome["failed_page"]
+
+def fetch_variants_in_order(product_ids, concurrency=VARIANT_CONCURRENCY, refresh=False):
+    # yields (product_id, variants, failed page or None) in the same order as product_ids while keeping
+    # at most `concurrency` products in flight so results for huge brands dont pile up in memory.
+    # `refresh` is a bool for every product or a callable deciding per product id
+    needs_refresh = refresh if callable(refresh) else (lambda product_id: refresh)
+    if concurrency <= 1:
+        for product_id in product_ids:
+            yield (product_id, *fetch_variants(product_id, needs_refresh(product_id)))
         return
 
-    all_item_mapping_ids = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="variants") as executor:
+        in_flight = deque()
+        for product_id in product_ids:
+            in_flight.append((product_id, executor.submit(fetch_variants, product_id, needs_refresh(product_id))))
+            if len(in_flight) >= concurrency:
+                done_id, future = in_flight.popleft()
+                yield (done_id, *future.result())
+        while in_flight:
+            done_id, future = in_flight.popleft()
+            yield (done_id, *future.result())
 
-    for brand in brands_response["data"]:
-        brand_id = brand.get("id")
-        brand_name = brand.get('name')
-        if not brand_id:
-            logger.warning("Brand missing id, skipping")
-            continue
+def collect_item_mapping_ids(product_id, variants, counts=None, rules=None):
+    # the itemMapping ids of the variants that pass the brand's eligibility rules, all variants of the
+    # product are checked at once. outcomes go to `counts` (collected plus variants rejected by each
+    # rule) for the rolled up summary line
+    item_mapping_ids, rejected = (rules or default_rules).evaluate(variants)
+    logger.debug("Product id %s: %d of %d variants eligible, rejected by rule: %s", product_id, len(item_mapping_ids), len(variants), rejected)
+    if counts is not None:
+        counts["collected"] = counts.get("collected", 0) + len(item_mapping_ids)
+        for rule, count in rejected.items():
+            counts[rule] = counts.get(rule, 0) + count
+    return item_mapping_ids
 
-        logger.info(f"Processing brand {brand_name} ({brand_id})")
-        
-        # get all product mappings for the brand
-        product_mappings = get_product_mappings(brand_id, brand_name)
-        if not product_mappings:
-            logger.warning(f"No product mappings data found for {brand_name} ({brand_id})")
-            continue
+def count_rejections(brand_name, counts):
+    for rule, count in counts.items():
+        if rule != "collected":
+            metrics.inc("variants_rejected_total", count, brand=brand_name, rule=rule)
+
+def count_accept_results(accept_response):
+    # count successes and failures for batch
+    data = accept_response.get("data") or []
+    errors = accept_response.get("errors") or []
 
-        # get each product id
+    # True==1, False==0
+    successes = sum(success.get("success", False) for success in data)
+    failures  = sum(not failure.get("success", True)  for failure in errors)
+    return successes, failures
+
+def confirmed_ids(batch_ids, accept_response):
+    # the ids of the batch the response shows as accepted. a fully successful batch confirms all of
+    # them, otherwise only result entries naming an id from the batch count
+    successes, failures = count_accept_results(accept_response)
+    if successes == len(batch_ids) and not failures:
+        return list(batch_ids)
+    batch = set(batch_ids)
+    return [entry["id"] for entry in accept_response.get("data") or [] if entry.get("success") and entry.get("id") in batch]
+
+def refused_ids(batch_ids, accept_response):
+    # the ids of the batch the response names as not accepted, under errors or as a failed data entry
+    batch = set(batch_ids)
+    entries = [entry for entry in accept_response.get("data") or [] if not entry.get("success", True)]
+    entries += [entry for entry in accept_response.get("errors") or [] if not entry.get("success", False)]
+    return [entry["id"] for entry in entries if entry.get("id") in batch]
+
+def batch_rejected(status_code, accept_response):
+    # a 4xx other than auth / throttling means the server looked at the batch and refused it
+    return accept_response is None and status_code is not None and 400 <= status_code < 500 and status_code not in (401, 429)
+
+def iter_product_ids(brand_id, brand_name, state=None, progress=None, first_item=0, index=None):
+    # get each product id, one product mappings page at a time. with a state store, products whose
+    # mapping entry hasnt changed since they were last checked are skipped and every yielded product
+    # remembers where its page starts so the brand can be checkpointed page by page. with a run index,
+    # products another brand in this run already crawled are skipped too
+    for offset, product_mappings in iter_product_mapping_pages(brand_id, brand_name, first_item=first_item, outcome=progress):
         for product in product_mappings:
-            product_id = product.get("id")
+            product_id = product.id
             if not product_id:
                 logger.warning("Product mapping entry missing id. Skipping product")
                 continue
-
-            logger.info(f"Processing product mapping id: {product_id}")
-            
-            # retrieve all variants for each product id
-            variants = get_product_variants(product_id)
-            if not variants:
-                logger.warning(f"No variants data found for product id: {product_id}")
+            if progress is not None:
+                progress["seen"] += 1
+            metrics.inc("products_scanned_total", brand=brand_name)
+            if index is not None and not index.claim_product(product_id):
+                logger.debug("Product %s already crawled in this run, skipping", product_id)
                 continue
+            if state:
+                mapping_fingerprint = product.fingerprint
+                status = state.product_status(product_id, mapping_fingerprint)
+                if status == "unchanged":
+                    progress["skipped"] += 1
+                    metrics.inc("products_skipped_total", brand=brand_name)
+                    continue
+                if status == "changed":
+                    # a cached variants page would be from before the change
+                    progress["changed"].add(product_id)
+                progress["fingerprints"][product_id] = mapping_fingerprint
+                progress["offsets"][product_id] = offset
+            yield product_id
 
-            # get the "itemMapping" ids from each variant only if inventory > 6 and all info provided == True
-            for variant in variants:
-                inventory = variant.get("inventoryAmount", 0)
-                if inventory > 6:
-                    item_mapping = variant.get("itemMapping")
-                    all_info_provided = item_mapping.get('allInformationForImportProvided')
-                    if item_mapping and "id" in item_mapping and all_info_provided:
-                        item_mapping_id = item_mapping["id"]
-                        all_item_mapping_ids.append(item_mapping_id)
-                        logger.info(f"Collected itemMapping id: {item_mapping_id} from a variant with inventory {inventory}")
-                    else:
-                        if not all_info_provided:
-                            logger.warning(f"Variant in product id {product_id} isnt ready for import")
-                else:
-                    logger.info(f"Skipping variant in product id {product_id} because inventory is {inventory}")
-
-    # process and accept the collected item mapping ids in batches and stop at TARGET
-    batch_size = 30
-    total_items = len(all_item_mapping_ids)
-    accepted_count = 0
-    TARGET = 10000
-
-    if total_items:
-        logger.info(f"Total collected itemMapping ids: {total_items} for {brand_name} ({brand_id})")
-        for i in range(0, total_items, batch_size):
-            if accepted_count >= TARGET:
-                logger.info(f"Reached target of {TARGET} accepted items; stopping further accepts")
-                break
+# accepted-id cap shared by every batcher in a run, batchers may run on different threads
+class AcceptTarget:
+    def __init__(self, target=ACCEPT_TARGET):
+        self.target = target
+        self.accepted_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def reached(self):
+        return self.accepted_count >= self.target
 
-            batch_ids = all_item_mapping_ids[i:i+batch_size]
-            logger.info(f"Accepting batch of {len(batch_ids)} itemMapping ids: {batch_ids}")
-            accept_response = accept_item_mappings(batch_ids)
-            if accept_response:
-                logger.info(f"Successfully accepted batch - response: {accept_response}")
-                # count successes and failures for batch
-                data = accept_response.get("data", [])
-                errors = accept_response.get("errors", [])
-
-                # True==1, False==0
-                successes = sum(success.get("success", False) for success in data)
-                failures  = sum(not failure.get("success", True)  for failure in errors)
-
-                accepted_count += successes
-                logger.info(f"Batch result for {brand_name}: {successes} succeeded, {failures} failed; total accepted: {accepted_count}")
+    def add(self, count):
+        with self.lock:
+            self.accepted_count += count
+
+# grows the accept batch while full batches come back fast and clean, halves it on errors or latency spikes
+class AdaptiveBatchSize:
+    def __init__(self, initial=ACCEPT_BATCH_SIZE, maximum=ACCEPT_MAX_BATCH_SIZE, latency_target=ACCEPT_LATENCY_TARGET):
+        self.size = initial
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.avg_latency = None
+        self.lock = threading.Lock()
+
+    def record(self, batch_len, elapsed, ok):
+        with self.lock:
+            spike = self.avg_latency is not None and elapsed > 2 * self.avg_latency
+            if ok and not spike and elapsed < self.latency_target:
+                # grow from the batch that just went through, not the current size, so batches still
+                # queued at an older size dont each bump it again and short flushes dont count
+                self.size = max(self.size, min(self.maximum, batch_len + max(1, batch_len // 4)))
             else:
-                logger.error(f"Failed to accept batch of itemMapping ids: {batch_ids}")
-            time.sleep(1) # ico rate limits
-    else:
-        logger.warning("No itemMapping ids collected for acceptance")
+                self.size = max(1, self.size // 2)
+            self.avg_latency = elapsed if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * elapsed
+
+# accept stage of the pipeline: batches queued by the crawl are sent by worker threads
+class AcceptStage:
+    def __init__(self, workers=ACCEPT_WORKERS, queue_size=ACCEPT_QUEUE_SIZE, stop=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        # once `stop` is set, queued batches are left pending in the state store instead of being sent
+        self.stop = stop
+        # one batch size for the whole run so every brand benefits from what the endpoint has shown so far
+        self.batch_size = AdaptiveBatchSize()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"accept-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, batcher, batch_ids, brand_name):
+        # blocks while the queue is full, which is the backpressure on the crawl
+        self.queue.put((batcher, batch_ids, brand_name))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batcher, batch_ids, brand_name = item
+            try:
+                if self.stop is None or not self.stop.is_set():
+                    batcher.send_batch(batch_ids, brand_name)
+            except Exception:
+                logger.exception(f"Accept batch for {brand_name} failed")
+            finally:
+                batcher.batch_done()
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+# buffers collected ids and sends an accept call as soon as a batch fills, stops at target.
+# with an accept stage the batches are handed off and sent while the crawl carries on
+class AcceptBatcher:
+    def __init__(self, batch_size=None, target=None, state=None, stage=None):
+        self.batch_size = batch_size or (stage.batch_size if stage else AdaptiveBatchSize())
+        self.target = target or AcceptTarget()
+        self.state = state
+        self.stage = stage
+        self.pending = []
+        self.collected_count = 0
+        self.accepted_count = 0
+        self.failed_batches = 0
+        self.outstanding = 0
+        self.cond = threading.Condition()
+
+    @property
+    def reached_target(self):
+        return self.target.reached
+
+    def add(self, item_mapping_ids, brand_name):
+        self.pending.extend(item_mapping_ids)
+        self.collected_count += len(item_mapping_ids)
+        while len(self.pending) >= self.batch_size.size and not self.reached_target:
+            self.dispatch(brand_name)
+
+    def flush(self, brand_name):
+        while self.pending and not self.reached_target:
+            self.dispatch(brand_name)
+        self.wait()
+        if self.reached_target:
+            logger.info(f"Reached target of {self.target.target} accepted items; stopping further accepts")
+            self.pending = []
+
+    def dispatch(self, brand_name):
+        size = self.batch_size.size
+        batch_ids = self.pending[:size]
+        del self.pending[:size]
+        if self.stage is None:
+            self.send_batch(batch_ids, brand_name)
+            return
+        with self.cond:
+            self.outstanding += 1
+        self.stage.submit(self, batch_ids, brand_name)
+
+    def batch_done(self):
+        with self.cond:
+            self.outstanding -= 1
+            self.cond.notify_all()
+
+    def wait(self):
+        # until every batch handed to the accept stage has come back
+        with self.cond:
+            self.cond.wait_for(lambda: self.outstanding == 0)
+
+    def send_batch(self, batch_ids, brand_name):
+        logger.info("Accepting batch of %d itemMapping ids for %s", len(batch_ids), brand_name)
+        logger.debug("Accept batch ids: %s", tuple(batch_ids))
+        if self.state:
+            self.state.mark_in_flight(batch_ids)
+        status_code, accept_response, elapsed = post_accept_item_mappings(batch_ids)
+        self.batch_size.record(len(batch_ids), elapsed, accept_response is not None)
+        if batch_rejected(status_code, accept_response):
+            # the server rejected the whole batch, most likely because of one bad id. split it
+            # so the good ids still go through and the bad ones get pinned down
+            settled = self.bisect(batch_ids, brand_name)
+        else:
+            settled = self.record_result(batch_ids, accept_response, brand_name)
+        # only ids that were accepted or rejected outright leave the pending table, the rest (a 5xx,
+        # no response, ids a partly failed batch didnt mention) are sent again by the next run until
+        # they run out of attempts
+        if self.state:
+            unsettled = set(batch_ids) - set(settled)
+            self.state.clear_pending(settled)
+            self.state.mark_in_flight(unsettled, in_flight=False)
+            exhausted = self.state.drop_exhausted(unsettled, ACCEPT_MAX_ATTEMPTS)
+            if exhausted:
+                metrics.inc("ids_dropped_total", len(exhausted), brand=brand_name, reason="attempts")
+                logger.error(f"Giving up on {len(exhausted)} itemMapping ids for {brand_name} after {ACCEPT_MAX_ATTEMPTS} accept attempts without a result")
+                logger.debug("Dropped ids: %s", tuple(exhausted))
+
+    def bisect(self, batch_ids, brand_name):
+        # returns the ids that were accepted or pinned down as rejected
+        if len(batch_ids) == 1:
+            logger.error(f"itemMapping id {batch_ids[0]} rejected by accept endpoint for {brand_name}")
+            self.record_result(batch_ids, None, brand_name)
+            return list(batch_ids)
+        settled = []
+        middle = len(batch_ids) // 2
+        for half in (batch_ids[:middle], batch_ids[middle:]):
+            status_code, accept_response, elapsed = post_accept_item_mappings(half)
+            if batch_rejected(status_code, accept_response):
+                settled += self.bisect(half, brand_name)
+            else:
+                settled += self.record_result(half, accept_response, brand_name)
+        return settled
+
+    def record_result(self, batch_ids, accept_response, brand_name):
+        # returns the ids the response settled, confirmed as accepted or explicitly refused
+        if accept_response:
+            logger.debug("Accept response: %s", accept_response)
+            successes, failures = count_accept_results(accept_response)
+            with self.cond:
+                self.accepted_count += successes
+                accepted_count = self.accepted_count
+            self.target.add(successes)
+            metrics.inc("ids_accepted_total", successes, brand=brand_name)
+            logger.info("Batch result for %s: %d succeeded, %d failed; total accepted: %d", brand_name, successes, failures, accepted_count)
+            accepted = confirmed_ids(batch_ids, accept_response)
+            if self.state:
+                self.state.mark_accepted(accepted)
+            refused = refused_ids(batch_ids, accept_response)
+            if refused:
+                metrics.inc("ids_dropped_total", len(refused), brand=brand_name, reason="refused")
+                logger.error(f"Accept endpoint refused {len(refused)} itemMapping ids for {brand_name}: {tuple(refused)}")
+            return accepted + refused
+        else:
+            with self.cond:
+                self.failed_batches += 1
+            metrics.inc("accept_batches_failed_total", brand=brand_name)
+            logger.error("Failed to accept batch of %d itemMapping ids for %s", len(batch_ids), brand_name)
+            logger.debug("Failed batch ids: %s", tuple(batch_ids))
+            return []
+
+def iter_brands(brands_response):
+    # selectors stream brands as the brands list is paged, a plain {"data": [...]} response still works
+    if isinstance(brands_response, dict):
+        return iter(brands_response.get("data") or [])
+    return iter(brands_response or [])
+
+def process_brand(brand, target=None, state=None, variant_concurrency=VARIANT_CONCURRENCY, accept_stage=None, index=None, rules=None, stop=None):
+    # crawls one brand and accepts what it finds, returns a summary dict or None if the brand has no id.
+    # `rules` is a RuleSet or the selector's BrandRules, the default inventory and readiness rules without one.
+    # once the `stop` event is set the crawl ends after the product in hand and the brand resumes next run
+    brand_id = brand.get("id")
+    brand_name = brand.get('name')
+    if not brand_id:
+        logger.warning("Brand missing id, skipping")
+        return None
+    if stop is not None and stop.is_set():
+        return None
+
+    products_done = 0
+    if state:
+        products_done = state.start_brand(brand_id, brand_name)
+        if products_done is None:
+            logger.info(f"Brand {brand_name} ({brand_id}) already finished in an earlier run, skipping")
+            return None
+        if products_done:
+            logger.info(f"Resuming brand {brand_name} ({brand_id}) after {products_done} products")
+
+    rules = (rules or default_rules).for_brand(brand)
+    logger.info(f"Processing brand {brand_name} ({brand_id})")
+    logger.debug("Eligibility rules for %s: %s", brand_name, rules)
+    started_at = time.monotonic()
+    # ids are accepted in batches while the crawl is still running instead of after it
+    batcher = AcceptBatcher(target=target, state=state, stage=accept_stage)
+
+    # retrieve all variants for each product id, `variant_concurrency` products at a time
+    progress = {"seen": 0, "skipped": 0, "fingerprints": {}, "offsets": {}, "changed": set(), "failed_page": None, "truncated_at": None}
+    product_ids = iter_product_ids(brand_id, brand_name, state, progress, products_done, index)
+    refresh_brand = brand_id in CACHE_REFRESH_BRANDS or brand_name in CACHE_REFRESH_BRANDS
+    refresh = lambda product_id: refresh_brand or product_id in progress["changed"]
+    stopped = False
+    for product_id, variants, failed_page in fetch_variants_in_order(product_ids, variant_concurrency, refresh):
+        if stop is not None and stop.is_set():
+            stopped = True
+            break
+        if state:
+            progress["changed"].discard(product_id)
+            # products come back in page order, so reaching a page means every product before it is done
+            offset = progress["offsets"].pop(product_id)
+            if offset > products_done:
+                products_done = offset
+                state.checkpoint_brand(brand_id, products_done)
+
+        logger.debug("Processing product mapping id: %s", product_id)
+        if failed_page:
+            # only some of its variants came back, so it is not recorded as checked and the next run crawls it again
+            logger.warning("Variants of product id %s stopped at failed page %s, crawling it again next run", product_id, failed_page)
+            if state:
+                progress["fingerprints"].pop(product_id, None)
+        if not variants:
+            logger.warning("No variants data found for product id: %s", product_id)
+            variant_rollup.add(brand_name, products=1)
+            continue
+
+        counts = {}
+        item_mapping_ids = collect_item_mapping_ids(product_id, variants, counts, rules)
+        variant_rollup.add(brand_name, products=1, variants=len(variants), **counts)
+        metrics.inc("variants_scanned_total", len(variants), brand=brand_name)
+        metrics.inc("variants_filtered_total", len(variants) - len(item_mapping_ids), brand=brand_name)
+        count_rejections(brand_name, counts)
+        if index is not None:
+            item_mapping_ids = index.claim_item_mappings(item_mapping_ids)
+        if state:
+            item_mapping_ids = state.filter_unaccepted(item_mapping_ids)
+            # persisted as pending together with the product so a crash cant lose them
+            if failed_page:
+                state.record_pending(item_mapping_ids, brand_id, brand_name)
+            else:
+                state.record_product(product_id, brand_id, progress["fingerprints"].pop(product_id, None), variant_fingerprint(variants), item_mapping_ids, brand_name)
+        metrics.inc("ids_collected_total", len(item_mapping_ids), brand=brand_name)
+        batcher.add(item_mapping_ids, brand_name)
+        if batcher.reached_target:
+            break
+    variant_rollup.flush(brand_name)
+
+    if not progress["seen"]:
+        logger.warning(f"No product mappings data found for {brand_name} ({brand_id})")
+    elif state:
+        if progress["skipped"]:
+            logger.info(f"Skipped {progress['skipped']} of {progress['seen']} unchanged products for {brand_name} ({brand_id})")
+        state.record_brand_crawl(brand_id, brand_name, progress["seen"], progress["skipped"])
+
+    if not batcher.collected_count:
+        logger.warning(f"No itemMapping ids collected for acceptance for {brand_name} ({brand_id})")
+    elif not (stopped and state):
+        # a stopped brand doesnt wait for its accepts, the ids are pending in the state store for the next run
+        batcher.flush(brand_name)
+        logger.info(f"Total collected itemMapping ids: {batcher.collected_count} for {brand_name} ({brand_id}); total accepted: {batcher.accepted_count}")
+
+    if stopped:
+        # left unfinished too, the next run resumes from the last checkpoint
+        logger.info(f"Stopped {brand_name} ({brand_id}) early after {products_done} products")
+    elif progress["failed_page"]:
+        # left unfinished so the next run resumes the crawl from the page that failed
+        logger.error(f"Product mappings crawl for {brand_name} ({brand_id}) stopped early at page {progress['failed_page']}")
+    elif progress["truncated_at"] and state and not batcher.reached_target:
+        # left unfinished too, the next run carries on after the products this one got through
+        state.checkpoint_brand(brand_id, progress["truncated_at"])
+    elif state:
+        state.checkpoint_brand(brand_id, products_done, done=True)
+
+    return {
+        "brand_id": brand_id,
+        "brand_name": brand_name,
+        "products_seen": progress["seen"],
+        "products_skipped": progress["skipped"],
+        "collected": batcher.collected_count,
+        "accepted": batcher.accepted_count,
+        "failed_batches": batcher.failed_batches,
+        "failed_page": progress["failed_page"],
+        "truncated_at": progress["truncated_at"],
+        "stopped": stopped,
+        "elapsed": time.monotonic() - started_at,
+    }
+
+def resume_pending(state, target=None, index=None):
+    # accepts whatever an interrupted run collected but never got through, in-flight batches included
+    for brand_id, entry in state.pending_by_brand().items():
+        brand_name = entry["brand_name"]
+        item_mapping_ids = state.filter_unaccepted(entry["ids"])
+        state.clear_pending(set(entry["ids"]) - set(item_mapping_ids))
+        if index is not None:
+            # claimed so a crawl later in the run doesnt send them a second time
+            item_mapping_ids = index.claim_item_mappings(item_mapping_ids)
+        if not item_mapping_ids:
+            continue
+        logger.info(f"Resuming {len(item_mapping_ids)} pending itemMapping ids for {brand_name} ({brand_id}), {entry['in_flight']} were in flight")
+        batcher = AcceptBatcher(target=target, state=state)
+        batcher.pending = item_mapping_ids
+        batcher.collected_count = len(item_mapping_ids)
+        batcher.flush(brand_name)
+
+def log_cache_stats():
+    cache_stats = variant_cache.stats()
+    logger.info(f"Variant cache: {cache_stats['hits']} hits ({cache_stats['disk_hits']} from disk), {cache_stats['misses']} misses")
+
+def process_mapping_accept(get_brands_fn, variant_concurrency=VARIANT_CONCURRENCY, state=None, target=None, index=None):
+    # runs the brands from one selector one after another, see orchestrator.run_brands for the parallel version
+    # remembers accepted ids and unchanged products between runs so each run is a delta sync
+    state = state or get_state_store()
+    target = target or AcceptTarget()
+    index = index or RunIndex()
+    rules = selector_rules(get_brands_fn)
+    summaries = []
+    if state:
+        resume_pending(state, target, index)
+
+    accept_stage = AcceptStage()
+    try:
+        for brand in iter_brands(get_brands_fn()):
+            if target.reached:
+                break
+            if brand.get("id") and not index.claim_brand(brand["id"]):
+                logger.info(f"Brand {brand.get('name')} ({brand.get('id')}) already processed in this run, skipping")
+                continue
+            summary = process_brand(brand, target, state, variant_concurrency, accept_stage, index, rules)
+            if summary:
+                summaries.append(summary)
+    finally:
+        accept_stage.close()
+
+    if state:
+        state.finish_run()
+
+    if not summaries:
+        logger.error("No brands data found.")
+        return summaries
+
+    log_cache_stats()
+    return summaries
 
 if __name__ == "__main__":
     process_mapping_accept()
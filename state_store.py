@@ -0,0 +1,232 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from api.decoding import fingerprint
+from api.data_dir import data_path, ensure_parent_dir
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# set STATE_DB_PATH to an empty string to turn delta sync off and crawl everything every run
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', data_path('mappingbot_state.db'))
+# an unchanged product is still re-crawled after this long so inventory changes get picked up
+PRODUCT_RECHECK_SECONDS = int(os.getenv('PRODUCT_RECHECK_SECONDS', 60 * 60))
+# checkpoints used to be product mappings page numbers at this fixed page size
+LEGACY_PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accepted_item_mappings (
+    item_mapping_id TEXT PRIMARY KEY,
+    accepted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    product_id TEXT PRIMARY KEY,
+    brand_id TEXT,
+    mapping_fingerprint TEXT,
+    variant_fingerprint TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS brand_progress (
+    brand_id TEXT PRIMARY KEY,
+    brand_name TEXT,
+    products_done INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_item_mappings (
+    item_mapping_id TEXT PRIMARY KEY,
+    brand_id TEXT,
+    brand_name TEXT,
+    in_flight INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS brand_crawls (
+    brand_id TEXT PRIMARY KEY,
+    brand_name TEXT,
+    crawled_at REAL NOT NULL,
+    products_seen INTEGER,
+    products_skipped INTEGER
+);
+"""
+
+def variant_fingerprint(variants):
+    # Variant records only hold the fields the accept decision depends on
+    return fingerprint(variants)
+
+class StateStore:
+    def __init__(self, path=STATE_DB_PATH, recheck_seconds=PRODUCT_RECHECK_SECONDS):
+        self.path = path
+        self.recheck_seconds = recheck_seconds
+        ensure_parent_dir(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+        self.lock = threading.Lock()
+
+    def migrate(self):
+        # brand_progress rows from before page sizes were negotiated count pages, not products
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(brand_progress)")}
+        if "products_done" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE brand_progress ADD COLUMN products_done INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute("UPDATE brand_progress SET products_done = last_product_page * ?", (LEGACY_PAGE_SIZE,))
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(pending_item_mappings)")}
+        if "attempts" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE pending_item_mappings ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def filter_unaccepted(self, item_mapping_ids):
+        if not item_mapping_ids:
+            return []
+        with self.lock:
+            placeholders = ",".join("?" * len(item_mapping_ids))
+            rows = self.conn.execute(
+                f"SELECT item_mapping_id FROM accepted_item_mappings WHERE item_mapping_id IN ({placeholders})",
+                list(item_mapping_ids),
+            ).fetchall()
+        accepted = {row[0] for row in rows}
+        return [item_mapping_id for item_mapping_id in item_mapping_ids if item_mapping_id not in accepted]
+
+    def mark_accepted(self, item_mapping_ids):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO accepted_item_mappings (item_mapping_id, accepted_at) VALUES (?, ?)",
+                [(item_mapping_id, now) for item_mapping_id in item_mapping_ids],
+            )
+
+    def product_status(self, product_id, mapping_fingerprint):
+        # "unchanged" when the product mapping entry looks the same as last time and was checked recently,
+        # "recheck" when it looks the same but is due a recheck, "changed" when it is new or differs
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT mapping_fingerprint, checked_at FROM products WHERE product_id = ?", (product_id,)
+            ).fetchone()
+        if not row or row[0] != mapping_fingerprint:
+            return "changed"
+        return "unchanged" if time.time() - row[1] < self.recheck_seconds else "recheck"
+
+    def record_product(self, product_id, brand_id, mapping_fingerprint, variant_fingerprint, pending_ids=(), brand_name=None):
+        # the product and the ids collected from it are written in one transaction so a crash
+        # can never mark a product as checked while losing the ids it produced
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO products (product_id, brand_id, mapping_fingerprint, variant_fingerprint, checked_at) VALUES (?, ?, ?, ?, ?)",
+                (product_id, brand_id, mapping_fingerprint, variant_fingerprint, now),
+            )
+            self.add_pending(pending_ids, brand_id, brand_name, now)
+
+    def record_pending(self, item_mapping_ids, brand_id, brand_name=None):
+        # ids collected from a product that isnt recorded as checked, so the next run crawls it again
+        with self.lock, self.conn:
+            self.add_pending(item_mapping_ids, brand_id, brand_name, time.time())
+
+    def add_pending(self, item_mapping_ids, brand_id, brand_name, now):
+        # callers hold the lock and the transaction
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO pending_item_mappings (item_mapping_id, brand_id, brand_name, added_at) VALUES (?, ?, ?, ?)",
+            [(item_mapping_id, brand_id, brand_name, now) for item_mapping_id in item_mapping_ids],
+        )
+
+    ### CHECKPOINTS ###
+    # rows in brand_progress only exist while a run is going, a run that dies leaves them behind
+    # and the next run picks up from them instead of starting from the first product. a brand whose
+    # crawl stopped on a failing page or at the page cap is never marked done, so its row also outlives the run.
+    # progress is counted in products rather than pages so it survives a change of page size
+
+    def start_brand(self, brand_id, brand_name):
+        # returns how many products the crawl already got through, or None if the brand already finished
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT products_done, done FROM brand_progress WHERE brand_id = ?", (brand_id,)
+            ).fetchone()
+            if row is None:
+                self.conn.execute(
+                    "INSERT INTO brand_progress (brand_id, brand_name, updated_at) VALUES (?, ?, ?)",
+                    (brand_id, brand_name, time.time()),
+                )
+                return 0
+        if row[1]:
+            return None
+        return row[0]
+
+    def checkpoint_brand(self, brand_id, products_done, done=False):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE brand_progress SET products_done = ?, done = ?, updated_at = ? WHERE brand_id = ?",
+                (products_done, int(done), time.time(), brand_id),
+            )
+
+    def finish_run(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM brand_progress WHERE done = 1")
+
+    def pending_by_brand(self):
+        # ids collected but not yet accepted, including batches that were in flight when a run died
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT brand_id, brand_name, item_mapping_id, in_flight FROM pending_item_mappings ORDER BY added_at"
+            ).fetchall()
+        pending = {}
+        for brand_id, brand_name, item_mapping_id, in_flight in rows:
+            entry = pending.setdefault(brand_id, {"brand_name": brand_name, "ids": [], "in_flight": 0})
+            entry["ids"].append(item_mapping_id)
+            entry["in_flight"] += in_flight
+        return pending
+
+    def mark_in_flight(self, item_mapping_ids, in_flight=True):
+        # every time ids go out counts as an accept attempt
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE pending_item_mappings SET in_flight = ?, attempts = attempts + ? WHERE item_mapping_id = ?",
+                [(int(in_flight), int(in_flight), item_mapping_id) for item_mapping_id in item_mapping_ids],
+            )
+
+    def drop_exhausted(self, item_mapping_ids, max_attempts):
+        # removes the ids that went out `max_attempts` times without settling and returns them
+        item_mapping_ids = list(item_mapping_ids)
+        if not item_mapping_ids:
+            return []
+        with self.lock, self.conn:
+            placeholders = ",".join("?" * len(item_mapping_ids))
+            rows = self.conn.execute(
+                f"SELECT item_mapping_id FROM pending_item_mappings WHERE attempts >= ? AND item_mapping_id IN ({placeholders})",
+                [max_attempts, *item_mapping_ids],
+            ).fetchall()
+            exhausted = [row[0] for row in rows]
+            self.conn.executemany(
+                "DELETE FROM pending_item_mappings WHERE item_mapping_id = ?",
+                [(item_mapping_id,) for item_mapping_id in exhausted],
+            )
+        return exhausted
+
+    def clear_pending(self, item_mapping_ids):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM pending_item_mappings WHERE item_mapping_id = ?",
+                [(item_mapping_id,) for item_mapping_id in item_mapping_ids],
+            )
+
+    def record_brand_crawl(self, brand_id, brand_name, products_seen, products_skipped):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO brand_crawls (brand_id, brand_name, crawled_at, products_seen, products_skipped) VALUES (?, ?, ?, ?, ?)",
+                (brand_id, brand_name, time.time(), products_seen, products_skipped),
+            )
+
+    def close(self):
+        self.conn.close()
+
+_state_store = None
+
+def get_state_store():
+    global _state_store
+    if _state_store is None and STATE_DB_PATH:
+        _state_store = StateStore()
+    return _state_store